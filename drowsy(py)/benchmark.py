@@ -0,0 +1,220 @@
+# offline replay benchmark for the detection pipeline
+# replays every video file (and every directory of JPEG frames) in a folder through the same
+# detector / predictor / EAR path as drowsiness_detection.py, reports per-stage timing
+# percentiles and FPS, and checks the alarm decision against labels.csv when present:
+#
+#   source,alarm
+#   drive_awake.mp4,0
+#   drive_sleepy.mp4,1
+#   frames_0001,1
+#
+# usage: python benchmark.py recordings/ [--fps 10] [--detect-scales 0.5 1.0] [--json out.json]
+#        python benchmark.py recordings/ --motion-gate 4   # alarm check + skip ratio with motion gating
+#
+# several backends (--backend dlib68 dlib5 haar) are compared on speed, alarm accuracy against
+# the labels, and EAR agreement with the first backend listed (mean absolute EAR difference)
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import ear
+from drowsy_state import DrowsinessMonitor
+from face_tracker import FaceTracker, detect_faces
+from landmark_backends import BACKENDS, get_backend
+from motion_gate import MotionGate
+
+thresh = 0.25  # threshold
+closed_seconds = 3.0  # eyes closed this long --> alarm
+
+STAGES = ("decode", "grayscale", "gate", "detect", "landmarks", "ear")
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv", ".webm")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+# yields (timestamp in seconds, BGR frame, decode seconds) for a video or a JPEG sequence
+def replay(path, fps):
+    if os.path.isdir(path):
+        files = sorted(f for f in glob.glob(os.path.join(path, "*")) if f.lower().endswith(IMAGE_EXTS))
+        for i, name in enumerate(files):
+            start = time.perf_counter()
+            frame = cv2.imread(name)
+            yield i / fps, frame, time.perf_counter() - start
+        return
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or fps
+    i = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            decode = time.perf_counter() - start
+            if not ret:
+                return
+            yield i / fps, frame, decode
+            i += 1
+    finally:
+        cap.release()
+
+
+def list_sources(folder):
+    sources = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if os.path.isdir(path) or name.lower().endswith(VIDEO_EXTS):
+            sources.append(name)
+    return sources
+
+
+def load_labels(folder):
+    path = os.path.join(folder, "labels.csv")
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="") as f:
+        return {row["source"]: row["alarm"].strip() == "1" for row in csv.DictReader(f)}
+
+
+def run_source(path, backend, fps=10.0, detect_scales=(1.0,), keyframe_interval=1, motion_gate=0.0):
+    # keyframe_interval > 1 times the face-tracking mode: "detect" is then detect-or-track
+    tracker = None
+    if keyframe_interval > 1:
+        tracker = FaceTracker(keyframe_interval=keyframe_interval, detect_scales=detect_scales, backend=backend)
+    gate = MotionGate(motion_gate) if motion_gate > 0 else None
+    face_ear = None
+    timings = {stage: [] for stage in STAGES}
+    frame_ears = []
+    monitor = DrowsinessMonitor(thresh, closed_seconds)
+    first_alarm = None
+    frames = 0
+    wall = time.perf_counter()
+    for timestamp, frame, decode in replay(path, fps):
+        if frame is None:
+            continue
+        frames += 1
+        timings["decode"].append(decode)
+        t0 = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        t1 = time.perf_counter()
+        timings["grayscale"].append(t1 - t0)
+        run = gate is None or gate.should_run(gray, timestamp)
+        if gate is not None:
+            timings["gate"].append(time.perf_counter() - t1)
+        if run:  # otherwise the eyes did not move and the previous face_ear is reused
+            t1 = time.perf_counter()
+            rects = tracker.update(gray) if tracker else detect_faces(backend.detect, gray, detect_scales)
+            t2 = time.perf_counter()
+            shapes = np.array([backend.predict(gray, rect) for rect in rects])
+            t3 = time.perf_counter()
+            _, _, ears, _ = ear.batch_ratios(shapes)
+            t4 = time.perf_counter()
+            timings["detect"].append(t2 - t1)
+            timings["landmarks"].append(t3 - t2)
+            timings["ear"].append(t4 - t3)
+            face_ear = float(ears.min()) if len(ears) else None
+            if gate is not None:
+                gate.update(gray, shapes, timestamp)
+        frame_ears.append(face_ear)
+        # replayed timestamps, so alarm decisions do not depend on how fast this machine is
+        if monitor.update(face_ear, timestamp) and first_alarm is None:
+            first_alarm = timestamp
+    wall = time.perf_counter() - wall
+    return {
+        "frames": frames,
+        "fps": frames / wall if wall > 0 else 0.0,
+        "alarm": first_alarm is not None,
+        "first_alarm_s": first_alarm,
+        "stages": {stage: percentiles(values) for stage, values in timings.items()},
+        "skip_ratio": gate.skip_ratio() if gate is not None else 0.0,
+        "ears": frame_ears,
+    }
+
+
+# mean absolute EAR difference over frames where both runs found a face
+def ear_agreement(ears, reference):
+    pairs = [(a, b) for a, b in zip(ears, reference) if a is not None and b is not None]
+    if not pairs:
+        return None
+    return float(np.mean([abs(a - b) for a, b in pairs]))
+
+
+# p50 / p90 / p99 / mean in milliseconds
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "mean": None}
+    ms = np.asarray(values) * 1000.0
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"p50": round(float(p50), 3), "p90": round(float(p90), 3),
+            "p99": round(float(p99), 3), "mean": round(float(ms.mean()), 3)}
+
+
+def print_report(name, result, expected):
+    check = ""
+    if expected is not None:
+        check = "OK" if result["alarm"] == expected else "MISMATCH (expected alarm=%d)" % expected
+    skipped = f', {result["skip_ratio"]:.0%} skipped' if result["skip_ratio"] else ""
+    print(f'[{result["backend"]}] {name}: {result["frames"]} frames, {result["fps"]:.1f} FPS{skipped}, alarm={int(result["alarm"])} {check}')
+    for stage in STAGES:
+        p = result["stages"][stage]
+        if p["p50"] is not None:
+            print(f'  {stage:<10} p50 {p["p50"]:8.2f} ms  p90 {p["p90"]:8.2f} ms  p99 {p["p99"]:8.2f} ms')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded sessions through the detection pipeline")
+    parser.add_argument("folder", help="folder of videos and/or JPEG sequence directories")
+    parser.add_argument("--fps", type=float, default=10.0, help="frame rate of JPEG sequences")
+    parser.add_argument("--detect-scales", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--keyframe-interval", type=int, default=1, help="face-tracking mode: detect every K frames")
+    parser.add_argument("--motion-gate", type=float, default=0.0,
+                        help="skip landmarks while the eye region changes less than this mean gray level (0 = off)")
+    parser.add_argument("--backend", nargs="+", default=["dlib68"], choices=sorted(BACKENDS),
+                        help="landmark backends to compare; the first one is the EAR reference")
+    parser.add_argument("--json", default=None, help="write the full results to this file")
+    args = parser.parse_args(argv)
+
+    labels = load_labels(args.folder)
+    sources = list_sources(args.folder)
+    results = {}
+    mismatches = 0
+    summary = []
+    for backend_name in args.backend:
+        start = time.perf_counter()
+        backend = get_backend(backend_name)
+        results[backend_name] = {}
+        for name in sources:
+            result = run_source(os.path.join(args.folder, name), backend, args.fps,
+                                tuple(sorted(args.detect_scales)), args.keyframe_interval, args.motion_gate)
+            result["backend"] = backend_name
+            expected = labels.get(name)
+            result["expected_alarm"] = expected
+            if expected is not None and expected != result["alarm"]:
+                mismatches += 1
+            reference = results[args.backend[0]].get(name)
+            result["ear_mae"] = ear_agreement(result["ears"], reference["ears"]) if reference else None
+            results[backend_name][name] = result
+            print_report(name, result, expected)
+        runs = list(results[backend_name].values())
+        frames = sum(r["frames"] for r in runs)
+        labeled = [r for r in runs if r["expected_alarm"] is not None]
+        correct = sum(r["alarm"] == r["expected_alarm"] for r in labeled)
+        maes = [r["ear_mae"] for r in runs if r["ear_mae"] is not None]
+        summary.append((backend_name, frames, frames / (time.perf_counter() - start),
+                        "%d/%d" % (correct, len(labeled)), np.mean(maes) if maes else float("nan")))
+    print(f'{"backend":<8} {"frames":>7} {"FPS":>7} {"alarms ok":>10} {"EAR MAE":>8}')
+    for backend_name, frames, fps, accuracy, mae in summary:
+        print(f'{backend_name:<8} {frames:>7} {fps:>7.1f} {accuracy:>10} {mae:>8.3f}')
+    print(f'{len(sources)} sources, {mismatches} alarm mismatches')
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
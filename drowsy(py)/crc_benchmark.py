@@ -0,0 +1,58 @@
+# micro-benchmark for the rpc CRC-16 implementations
+# checks that the bitwise, table and binascii.crc_hqx paths give identical CRCs for random
+# payloads (including JPEG-sized 30-60KB ones) and reports the time per frame of each path
+#
+# usage: python crc_benchmark.py [--rounds 20] [--sizes 8 1400 30000 60000]
+import argparse
+import os
+import sys
+import time
+
+import rpc
+
+
+# the previous table loop (crc never masked inside the loop), kept as the compatibility reference
+def legacy_tab_crc_16(data, size):
+    table = rpc.rpc._rpc__crc_16_table
+    crc = 0xFFFF
+    for i in range(size): crc = table[((crc >> 8) ^ data[i]) & 0xff] ^ (crc << 8)
+    return crc & 0xFFFF
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="rpc CRC-16 compatibility check and timing")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 1400, 30000, 60000])
+    args = parser.parse_args(argv)
+
+    r = rpc.rpc()
+    impls = [("legacy", legacy_tab_crc_16), ("bitwise", r._rpc__def_crc_16), ("table", r._rpc__tab_crc_16)]
+    if rpc.crc_hqx is not None:
+        impls.append(("crc_hqx", r._rpc__fast_crc_16))
+
+    # compatibility: every implementation must agree on every size, including odd and empty ones
+    for size in sorted(set(args.sizes) | {0, 1, 2, 3, 255, 256, 1023}):
+        for _ in range(3):
+            data = bytearray(os.urandom(size + 2))  # packets carry 2 trailing CRC bytes
+            crcs = {name: fn(data, size) for name, fn in impls}
+            if len(set(crcs.values())) != 1:
+                print(f'MISMATCH size={size}: {crcs}')
+                return 1
+    print(f'{len(impls)} implementations agree byte-for-byte')
+
+    for size in args.sizes:
+        data = bytearray(os.urandom(size + 2))
+        line = [f'{size:>6} B']
+        for name, fn in impls:
+            rounds = 1 if name in ("legacy", "bitwise") and size > 10000 else args.rounds
+            start = time.perf_counter()
+            for _ in range(rounds):
+                fn(data, size)
+            per_call = (time.perf_counter() - start) / rounds
+            line.append(f'{name} {per_call * 1e6:10.1f} us')
+        print('  '.join(line))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,24 +2,28 @@ import sys
 from PySide6 import QtCore, QtWidgets, QtGui
 from PySide6.QtGui import QPixmap
 import cv2
-import numpy as np
 import serial.tools.list_ports
-import dlib
-from imutils import face_utils
-from scipy.spatial import distance
-from pygame import mixer
 import rpc
-
-mixer.init()
-mixer.music.load("music.wav")
+import model_registry
+import esp32_camera
+import ear
+from face_tracker import FaceTracker
+from drowsy_state import DrowsinessMonitor
+from frame_cache import FrameCache, exact_key
 
 # Constants for drowsiness detection
 thresh = 0.25  # Threshold for eye aspect ratio
-frame_check = 60  # Number of frames to check for drowsiness
-
-# Load face detection model
-detector = dlib.get_frontal_face_detector()
-predict = dlib.shape_predictor("models/shape_predictor_68_face_landmarks.dat")  # Update with the path to your model file
+closed_seconds = 3.0  # Seconds of continuous eye closure before the alarm, independent of frame rate
+max_gap = 2.0  # A longer pause between frames (slow RPC, reconnect) restarts the closure count; a frame without a face always does
+keyframe_interval = 5  # Run the face detector every K frames and track the face in between
+detect_scales = (0.5, 1.0)  # Detect on a downscaled copy first, landmarks always at native resolution
+landmark_backend = "dlib68"  # dlib68, dlib5, haar, lbp or onnx (see landmark_backends)
+decode_flags = esp32_camera.DECODE_COLOR  # DECODE_COLOR_HALF decodes the JPEG at half size
+stream_mode = True  # Stream frames at the camera's rate (rpc stream_reader) instead of polling once per second; falls back to polling when the firmware cannot stream
+stream_queue_depth = 4  # Frames in flight between the ESP32 and this app in stream mode
+result_cache_size = 32  # Results of recent frames; an unchanged frame reuses its landmarks / EAR (0 disables)
+
+# Face detection models and the alarm sound are loaded on first use (see model_registry)
 
 class ImgLabel(QtWidgets.QLabel):
     clicked = QtCore.Signal()
@@ -40,8 +44,13 @@ class EspCamWidget(QtWidgets.QWidget):
     def __init__(self):
         super().__init__()
         self.rpc_master = None
+        self.camera = None
+        self.stream_thread = None
         self.capture_timer = None
-        self.drowsy_counter = 0
+        self.monitor = DrowsinessMonitor(thresh, closed_seconds, max_gap)
+        self.tracker = FaceTracker(keyframe_interval=keyframe_interval,
+                                   detect_scales=detect_scales, backend=landmark_backend)
+        self.result_cache = FrameCache(result_cache_size)
         self.music_playing = False  # Flag to indicate if music is playing
         self.populate_ui()
 
@@ -80,6 +89,9 @@ class EspCamWidget(QtWidgets.QWidget):
         port = self.esp32_port.currentText()
         try:
             self.rpc_master = rpc.rpc_usb_vcp_master(port)
+            self.camera = esp32_camera.Esp32Camera(self.rpc_master, decode_flags=decode_flags)
+            self.tracker.reset()
+            self.monitor.reset()
             self.esp32_button.setText("Connected")
             self.esp32_button.setEnabled(False)
             self.start_capture_timer()
@@ -88,60 +100,78 @@ class EspCamWidget(QtWidgets.QWidget):
 
     def start_capture_timer(self):
         self.capture_timer = QtCore.QTimer(self)
+        if stream_mode:
+            # frames arrive on a background thread; the timer only picks up the newest one
+            self.stream_thread = esp32_camera.StreamThread(self.camera, queue_depth=stream_queue_depth,
+                                                           decode_flags=decode_flags)
+            self.stream_thread.start()
+            self.capture_timer.timeout.connect(self.process_stream_frame)
+            self.capture_timer.start(10)
+        else:
+            self.capture_timer.timeout.connect(self.capture_photo)
+            self.capture_timer.start(1000)  # Capture every 1 second
+
+    def process_stream_frame(self):
+        if self.stream_thread.unsupported:
+            self.fall_back_to_polling()
+            return
+        img, captured_at = self.stream_thread.queue.get_latest(timeout=0)
+        if img is not None:
+            self.process_image(img, captured_at)
+
+    def fall_back_to_polling(self):  # firmware without jpeg_image_stream: poll like stream_mode = False
+        self.capture_timer.stop()
+        self.capture_timer.timeout.disconnect(self.process_stream_frame)
+        self.stream_thread = None
         self.capture_timer.timeout.connect(self.capture_photo)
-        self.capture_timer.start(1000)  # Capture every 1 second
+        self.capture_timer.start(1000)
+        QtWidgets.QMessageBox.warning(self, "Warning", "The ESP32 firmware does not support streaming "
+                                      "(jpeg_image_stream), capturing one photo per second instead.")
 
     def capture_photo(self):
         if self.rpc_master is None:
             return
 
         try:
-            result = self.rpc_master.call("jpeg_image_snapshot", recv_timeout=1000)
-            if result is not None:
-                jpg_sz = int.from_bytes(result.tobytes(), "little")
-                buf = bytearray(b'\x00' * jpg_sz)
-                result = self.rpc_master.call("jpeg_image_read", recv_timeout=1000)
-                self.rpc_master.get_bytes(buf, jpg_sz)
-                img = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
-                drowsy = self.detect_drowsiness(img)
-                if drowsy:
-                    print(1) #if detected close eyes print result 1
-                    self.drowsy_counter += 1
-                    if self.drowsy_counter >= 3 and not self.music_playing:  # Start music if not already playing
-                        mixer.music.play(-1)  # -1 loops the music indefinitely
-                        self.music_playing = True
-                        self.stop_music_button.setEnabled(True)
-                else:
-                    print(0) #if detected open eyes print result 0
-                    self.drowsy_counter = 0
-
-                self.update_image(img.copy())
+            # JPEG read into a pooled buffer and decoded in place; the JPEG bytes key the result cache
+            jpg = self.camera.snapshot()
+            img = esp32_camera.decode(jpg, decode_flags) if jpg is not None else None
+            if img is not None:
+                self.process_image(img, key=exact_key(jpg))
             else:
                 QtWidgets.QMessageBox.warning(self, "Warning", "Failed to capture photo.")
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, "Error", str(e))
 
-    def detect_drowsiness(self, img):
+    def process_image(self, img, captured_at=None, key=None):
+        face_ear = self.detect_drowsiness(img, key)
+        if face_ear is not None and face_ear < thresh:
+            print(1) #if detected close eyes print result 1
+        else:
+            print(0) #if detected open eyes print result 0
+        # alarm after closed_seconds of real time, however long each RPC round trip takes
+        if self.monitor.update(face_ear, captured_at) and not self.music_playing:  # Start music if not already playing
+            model_registry.get_mixer().music.play(-1)  # -1 loops the music indefinitely
+            self.music_playing = True
+            self.stop_music_button.setEnabled(True)
+
+        if self.isVisible() and not self.isMinimized():  # no QPixmap work nobody can see
+            self.update_image(img)  # update_image converts into a new array
+
+    def detect_drowsiness(self, img, key=None):
+        if result_cache_size:
+            key = key if key is not None else exact_key(img)  # stream mode: hash of the decoded frame
+            cached = self.result_cache.get(key)
+            if cached is not None:  # same picture as before, skip detector and predictor
+                return cached[1]
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        subjects = detector(gray, 0)
-        for subject in subjects:
-            shape = predict(gray, subject)
-            shape = face_utils.shape_to_np(shape)
-            left_eye = shape[42:48]
-            right_eye = shape[36:42]
-            left_ear = self.eye_aspect_ratio(left_eye)
-            right_ear = self.eye_aspect_ratio(right_eye)
-            ear = (left_ear + right_ear) / 2.0
-            if ear < thresh:
-                return True
-        return False
-
-    def eye_aspect_ratio(self, eye):
-        A = distance.euclidean(eye[1], eye[5])
-        B = distance.euclidean(eye[2], eye[4])
-        C = distance.euclidean(eye[0], eye[3])
-        ear = (A + B) / (2.0 * C)
-        return ear
+        subjects, shapes = self.tracker.landmarks(gray)
+        # EAR of every detected face in one vectorized pass; the lowest one, None without a face
+        _, _, ears, _ = ear.batch_ratios(shapes)
+        face_ear = float(ears.min()) if len(ears) else None
+        if result_cache_size:
+            self.result_cache.put(key, (shapes, face_ear))
+        return face_ear
 
     def update_image(self, img):
         img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
@@ -152,15 +182,19 @@ class EspCamWidget(QtWidgets.QWidget):
 
     def stop_music(self): #press button to stop music
         if self.music_playing:
-            mixer.music.stop()
+            model_registry.get_mixer().music.stop()
             self.music_playing = False
             self.stop_music_button.setEnabled(False)
 
     def closeEvent(self, event): # press X to close window and stop music
+        if self.stream_thread is not None:
+            self.stream_thread.stop()
+        if result_cache_size:
+            print("result cache:", self.result_cache.stats())
         if self.rpc_master is not None:
             self.rpc_master.close()
         if self.music_playing:
-            mixer.music.stop()
+            model_registry.get_mixer().music.stop()
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication([])
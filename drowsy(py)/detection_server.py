@@ -0,0 +1,224 @@
+# multi-camera drowsiness detection server
+# one reader thread per source (V4L2 device, video file or ESP32 rpc port) feeds frames to a
+# multiprocessing pool; workers take the dlib detector / shape predictor from model_registry, which
+# preloads them once (fork / forkserver) so all workers share the model pages copy-on-write.
+# results come back to the main process where the per-source alarm state is kept and an
+# eye_status event (same fields as the MQTT log payload) is printed as one JSON line per frame.
+# JPEG frames (ESP32 sources) that are byte-identical to a recent one reuse its result from a
+# per-source FrameCache and never reach the pool.
+#
+# usage: python detection_server.py 0 /dev/video2 drive.mp4 rpc:/dev/ttyACM0 rpcstream:/dev/ttyACM1
+import argparse
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import ear
+import model_registry
+from drowsy_state import DrowsinessMonitor
+from face_tracker import detect_faces
+from frame_cache import FrameCache, exact_key
+from landmark_backends import BACKENDS, get_backend
+
+thresh = 0.25  # threshold
+closed_seconds = 3.0  # eyes closed this long --> alarm
+model_path = model_registry.PREDICTOR_68
+
+# per worker process state, set by init_worker
+_backend = None
+_detect_scales = (1.0,)
+
+
+# dlib models are already preloaded when the pool comes from model_registry.mp_context (fork / forkserver)
+def init_worker(backend, detect_scales):
+    global _backend, _detect_scales
+    _backend = get_backend(backend)
+    _detect_scales = detect_scales
+
+
+# runs in a worker: frame is a grayscale array or the raw JPEG bytes from an ESP32
+def detect_frame(job):
+    source, seq, captured_at, frame = job
+    if isinstance(frame, (bytes, bytearray)):
+        frame = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)  # no extra copy
+    if frame is None:
+        return source, seq, captured_at, None
+    rects = detect_faces(_backend.detect, frame, _detect_scales)
+    shapes = np.array([_backend.predict(frame, rect) for rect in rects])
+    _, _, ears, _ = ear.batch_ratios(shapes)
+    return source, seq, captured_at, ears.tolist()
+
+
+# frame generators for each kind of source: yield (monotonic capture time, frame), stamped as soon as
+# the frame is read so time spent waiting for the pool (backpressure) does not age it
+def read_capture(spec):
+    cap = cv2.VideoCapture(int(spec) if spec.isdigit() else spec)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            captured_at = time.monotonic()
+            yield captured_at, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # ship 1/3 of the bytes to the worker
+    finally:
+        cap.release()
+
+
+def read_esp32(port, camera=None):
+    import rpc
+    from esp32_camera import Esp32Camera
+    if camera is None:
+        camera = Esp32Camera(rpc.rpc_usb_vcp_master(port))
+    while True:
+        jpg = camera.snapshot()
+        captured_at = time.monotonic()
+        if jpg is not None:
+            yield captured_at, jpg.tobytes()  # pooled buffer is reused, the worker gets its own copy to decode
+
+
+# streaming mode: frames pushed by the camera's stream_writer, newest frame wins; polls snapshots
+# instead when the firmware has no jpeg_image_stream
+def read_esp32_stream(port, queue_depth=4):
+    import rpc
+    from esp32_camera import Esp32Camera, StreamThread
+    camera = Esp32Camera(rpc.rpc_usb_vcp_master(port))
+    stream = StreamThread(camera, queue_depth=queue_depth, decode_flags=None)
+    stream.start()
+    try:
+        while True:
+            jpg, captured_at = stream.queue.get_latest()  # stamped when the frame arrived
+            if jpg is None:
+                if stream.unsupported:
+                    print(f'{port}: camera cannot stream (no jpeg_image_stream), polling snapshots', file=sys.stderr)
+                    yield from read_esp32(port, camera)
+                return
+            yield captured_at, jpg  # JPEG bytes, decoded in the worker
+    finally:
+        stream.stop()
+
+
+def open_source(spec):
+    if spec.startswith("rpcstream:"):
+        return read_esp32_stream(spec[10:])
+    if spec.startswith("rpc:"):
+        return read_esp32(spec[4:])
+    return read_capture(spec)
+
+
+class SourceState:
+
+    def __init__(self, name, cache_size=32, max_gap=2.0):
+        self.name = name
+        self.monitor = DrowsinessMonitor(thresh, closed_seconds, max_gap)  # alert state
+        self.last_seq = -1
+        self.inflight = threading.Semaphore(2)  # frames of this source queued in the pool
+        self.cache = FrameCache(cache_size)  # JPEG hash --> EARs
+        self.pending = {}  # seq --> JPEG hash of frames in the pool
+
+
+class DetectionServer:
+
+    def __init__(self, sources, processes=None, detect_scales=(1.0,), emit=None, start_method="forkserver",
+                 backend="dlib68", cache_size=32, max_gap=2.0):
+        self.sources = {spec: SourceState(spec, cache_size, max_gap) for spec in sources}
+        self.processes = processes or multiprocessing.cpu_count()
+        self.detect_scales = tuple(sorted(detect_scales))
+        self.emit = emit or print_event
+        self.start_method = start_method
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def _on_result(self, result):
+        source, seq, captured_at, ears = result
+        state = self.sources[source]
+        state.inflight.release()
+        key = state.pending.pop(seq, None)
+        if ears is None:
+            return
+        if key is not None:
+            state.cache.put(key, ears)
+        with self.lock:
+            if seq < state.last_seq:  # a newer frame of this source already finished
+                return
+            state.last_seq = seq
+            face_ear = min(ears) if ears else None
+            alarm = state.monitor.update(face_ear, captured_at)
+            self.emit({
+                'source': source,
+                'eye_status': "1" if face_ear is not None and face_ear < thresh else "0",
+                'alarm_status': "1" if alarm else "0",
+                'ear': face_ear,
+                'timestamp': str(datetime.now()),
+            })
+
+    def _on_error(self, state, seq, err):
+        state.inflight.release()
+        state.pending.pop(seq, None)
+        print(f'{state.name}: worker error: {err}', file=sys.stderr)
+
+    def _read(self, spec):
+        state = self.sources[spec]
+        for seq, (captured_at, frame) in enumerate(open_source(spec)):
+            state.inflight.acquire()  # backpressure: never queue more than a couple of frames
+            if state.cache.capacity and isinstance(frame, (bytes, bytearray)):
+                key = exact_key(frame)
+                ears = state.cache.get(key)
+                if ears is not None:  # unchanged picture, the alarm clock still advances
+                    self._on_result((spec, seq, captured_at, ears))
+                    continue
+                state.pending[seq] = key
+            self.pool.apply_async(detect_frame, ((spec, seq, captured_at, frame),),
+                                  callback=self._on_result,
+                                  error_callback=lambda err, state=state, seq=seq: self._on_error(state, seq, err))
+        print(f'source {spec} finished, result cache {state.cache.stats()}', file=sys.stderr)
+
+    def run(self):
+        # only dlib68 uses the dlib models; the other backends load their own on first use
+        ctx = model_registry.mp_context(self.start_method, model_path if self.backend == "dlib68" else None)
+        self.pool = ctx.Pool(self.processes, initializer=init_worker, initargs=(self.backend, self.detect_scales))
+        readers = [threading.Thread(target=self._read, args=(spec,), daemon=True) for spec in self.sources]
+        for reader in readers:
+            reader.start()
+        try:
+            for reader in readers:
+                reader.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.pool.close()
+            self.pool.join()
+
+
+def print_event(event):
+    print(json.dumps(event), flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drowsiness detection server for many cameras")
+    parser.add_argument("sources", nargs="+",
+                        help="camera index, video file / device path, rpc:<serial port> (polled) or "
+                             "rpcstream:<serial port> (streamed) for an ESP32")
+    parser.add_argument("-j", "--processes", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--detect-scales", type=float, nargs="+", default=[1.0],
+                        help="detection pyramid scales, smallest tried first")
+    parser.add_argument("--backend", default="dlib68", choices=sorted(BACKENDS), help="face / landmark backend")
+    parser.add_argument("--result-cache", type=int, default=32,
+                        help="recent JPEG frames per source whose result is reused when repeated (0 disables)")
+    parser.add_argument("--max-gap", type=float, default=2.0,
+                        help="a longer pause between frames of a source restarts its eyes-closed count (seconds)")
+    parser.add_argument("--start-method", default="forkserver", choices=["fork", "forkserver", "spawn"],
+                        help="how workers start; fork/forkserver share the preloaded models copy-on-write")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    DetectionServer(args.sources, args.processes, args.detect_scales, start_method=args.start_method,
+                    backend=args.backend, cache_size=args.result_cache, max_gap=args.max_gap).run()
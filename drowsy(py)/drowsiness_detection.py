@@ -1,38 +1,90 @@
 # import libraries
-from scipy.spatial import distance
-from imutils import face_utils
-import imutils
-import dlib
 import cv2
+import numpy as np
+import argparse
+import json
 import os
+import sys
 import glob
-from pygame import mixer
+import time
+from datetime import datetime
 import rpc
+import ear
+import model_registry
+from face_tracker import FaceTracker
+from landmark_backends import BACKENDS
+from drowsy_state import DrowsinessMonitor
+from frame_queue import FrameQueue, CaptureThread, frame_age
+from motion_gate import MotionGate
 
-mixer.init()
-mixer.music.load("music.wav")
+# --headless: no window, no drawing, no pygame; alarms are printed as JSON lines
+# --preview: optionally write an annotated JPEG snapshot at a low rate instead of a window
+parser = argparse.ArgumentParser(description="Drowsiness detection from a webcam")
+parser.add_argument("--headless", action="store_true", help="skip all visualization work")
+parser.add_argument("--sound", action="store_true", help="play the alarm sound even in headless mode")
+parser.add_argument("--preview", default=None, help="path of a JPEG preview snapshot (headless only)")
+parser.add_argument("--preview-fps", type=float, default=1.0, help="preview snapshot rate")
+parser.add_argument("--camera", type=int, default=0, help="webcam index")
+parser.add_argument("--backend", default="dlib68", choices=sorted(BACKENDS), help="face / landmark backend")
+parser.add_argument("--motion-gate", type=float, default=0.0,
+                    help="skip landmarks while the eye region changes less than this mean gray level (0 = off)")
+parser.add_argument("--max-skip", type=float, default=1.0, help="recompute landmarks at least this often (seconds)")
+parser.add_argument("--max-gap", type=float, default=2.0,
+                    help="a longer pause between frames restarts the eyes-closed count (seconds)")
+args = parser.parse_args()
 
-# compute eye ratio
-# each eye is represented by 6 (x, y)-coordinates
-def eye_aspect_ratio(eye):
-    A = distance.euclidean(eye[1], eye[5])
-    B = distance.euclidean(eye[2], eye[4])
-    C = distance.euclidean(eye[0], eye[3])
-    ear = (A + B) / (2.0 * C)
-    return ear
+play_sound = not args.headless or args.sound  # pygame is imported on the first alarm only
 
 thresh = 0.25  # threshold
-frame_check = 60  # max_count
-detect = dlib.get_frontal_face_detector()  # face detection
-predict = dlib.shape_predictor(
-    "models/shape_predictor_68_face_landmarks.dat")  # .dat is a trained model
+closed_seconds = 3.0  # eyes closed this long (monotonic time, not frames) --> alarm
+keyframe_interval = 10  # run the face detector every K frames, track the face in between
+detect_scales = (0.25, 0.5, 0.7)  # detect on downscaled copies (0.7 ~ the old 450px-wide resize of a 640px frame), landmarks on the native frame
+tracker = FaceTracker(keyframe_interval=keyframe_interval, detect_scales=detect_scales, backend=args.backend)
 
-# extract the eye regions
-(lStart, lEnd) = face_utils.FACIAL_LANDMARKS_68_IDXS["left_eye"]
-(rStart, rEnd) = face_utils.FACIAL_LANDMARKS_68_IDXS["right_eye"]
+cap = cv2.VideoCapture(args.camera)  # webcam --> need change to esp32 cam
+monitor = DrowsinessMonitor(thresh, closed_seconds, args.max_gap, keep_on_no_face=True)  # alert state, frames without a face keep the count like the old flag did
+# optional: reuse the last EAR while the eyes do not move (see motion_gate)
+gate = MotionGate(args.motion_gate, args.max_skip) if args.motion_gate > 0 else None
+
+# capture on its own thread; inference always takes the newest frame (older ones are dropped)
+frames = FrameQueue(maxlen=2)
+capture = CaptureThread(cap, frames)
+capture.start()
+# load the face detector / 68-point predictor (.dat is a trained model) while the camera warms up
+if args.backend == "dlib68":
+    model_registry.preload()
+
+preview_interval = 1.0 / args.preview_fps if args.preview else None
+next_preview = 0.0
+
+
+# draw eye contours and alarm text on the frame (skipped in headless mode)
+def draw(frame, shapes, alarm, captured_at):
+    for shape in shapes:
+        leftEye, rightEye = ear.split_eyes(shape)
+        leftEye, rightEye = leftEye.astype(np.int32), rightEye.astype(np.int32)
+        leftEyeHull = cv2.convexHull(leftEye)
+        rightEyeHull = cv2.convexHull(rightEye)
+        # draw contours of eye region
+        cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
+        cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
+    if alarm:
+        cv2.putText(frame, "****************ALERT!****************", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        cv2.putText(frame, "****************ALERT!****************", (10, 325),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    # end-to-end latency from capture to decision
+    age_ms = frame_age(captured_at) * 1000
+    cv2.putText(frame, f"age: {age_ms:.0f} ms dropped: {frames.dropped}", (10, frame.shape[0] - 10),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+
+
+# write the preview snapshot atomically so a reader never sees half a JPEG
+def write_preview(frame):
+    tmp = args.preview + ".tmp.jpg"
+    cv2.imwrite(tmp, frame)
+    os.replace(tmp, args.preview)
 
-cap = cv2.VideoCapture(0)  # webcam --> need change to esp32 cam
-flag = 0  # count for alert
 
 # connect to esp32
 def connect_esp32(self):
@@ -40,41 +92,51 @@ def connect_esp32(self):
         self.rpc_master = rpc.rpc_usb_vcp_master(port)
 
 # **** detected by webcam ****
+shapes, face_ear = np.zeros((0, 68, 2)), None
+alarm_on = False  # headless: one JSON line per alarm on / off transition, not per frame
 while True:
-    ret, frame = cap.read()
-    frame = imutils.resize(frame, width=450)  # set frame
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # convert from RGB to gray
-    subjects = detect(gray, 0)
-    for subject in subjects:
-        shape = predict(gray, subject)
-        shape = face_utils.shape_to_np(shape)  # convert to NumPy array
-        leftEye = shape[lStart:lEnd]
-        rightEye = shape[rStart:rEnd]
-        leftEAR = eye_aspect_ratio(leftEye)
-        rightEAR = eye_aspect_ratio(rightEye)
-        ear = (leftEAR + rightEAR) / 2.0
-        leftEyeHull = cv2.convexHull(leftEye)
-        rightEyeHull = cv2.convexHull(rightEye)
-        # draw contours of eye region
-        cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
-        cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
-        # detect drowsiness logic
-        if ear < thresh:
-            flag += 1
-            print(flag)
-            # --> change to 1.(driver) sound alert 2.(owner) line notification
-            if flag >= frame_check:
-                cv2.putText(frame, "****************ALERT!****************", (10, 30),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                cv2.putText(frame, "****************ALERT!****************", (10, 325),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                # print ("Drowsy")
-                mixer.music.play()
-        else:
-            flag = 0
-    cv2.imshow("Frame", frame)
-    key = cv2.waitKey(1) & 0xFF
-    if key == ord("q"):
+    frame, captured_at = frames.get_latest(timeout=5)
+    if frame is None:
         break
-cv2.destroyAllWindows()
-cap.release()
\ No newline at end of file
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # convert from RGB to gray
+    if gate is None or gate.should_run(gray, captured_at):
+        subjects, shapes = tracker.landmarks(gray)  # shapes: (N, 68, 2)
+        # compute EAR for all faces in one vectorized pass
+        _, _, ears, _ = ear.batch_ratios(shapes)
+        face_ear = ears.min() if len(ears) else None
+        if gate is not None:
+            gate.update(gray, shapes, captured_at)
+    # else: eyes unchanged, shapes / face_ear of the last inference still hold
+    # detect drowsiness logic, keyed on the capture time of the frame
+    alarm = monitor.update(face_ear, captured_at)
+    if alarm:
+        # --> change to 1.(driver) sound alert 2.(owner) line notification
+        # print ("Drowsy")
+        if play_sound:
+            model_registry.get_mixer().music.play()
+        if not args.headless:
+            print(f'alarm: frame age {frame_age(captured_at) * 1000:.0f} ms')
+    elif monitor.closed_since is not None and not args.headless:
+        print(f'closed: {monitor.closed_duration(captured_at):.1f} s')
+    if args.headless and bool(alarm) != alarm_on:
+        alarm_on = bool(alarm)
+        print(json.dumps({'eye_status': "1" if face_ear is not None and face_ear < thresh else "0",
+                          'alarm_status': "1" if alarm else "0", 'timestamp': str(datetime.now()),
+                          'frame_age_ms': round(frame_age(captured_at) * 1000)}), flush=True)
+    if not args.headless:
+        draw(frame, shapes, alarm, captured_at)
+        cv2.imshow("Frame", frame)
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord("q"):
+            break
+    elif preview_interval is not None and time.monotonic() >= next_preview:
+        next_preview = time.monotonic() + preview_interval
+        draw(frame, shapes, alarm, captured_at)
+        write_preview(frame)
+capture.stop()
+capture.join()
+if gate is not None:
+    print(f'motion gate: skipped {gate.skipped}/{gate.frames} frames ({gate.skip_ratio():.0%})', file=sys.stderr)
+if not args.headless:
+    cv2.destroyAllWindows()
+cap.release()
@@ -0,0 +1,65 @@
+# time-based drowsiness state machine
+# the alarm fires once the eyes stay closed for closed_seconds of monotonic time, independent of
+# how many frames per second the pipeline manages; EAR samples are kept in a fixed-size ring buffer
+# a frame without a face ends the streak unless keep_on_no_face is set (a face lost for a moment,
+# e.g. a nodding head, then does not restart the count)
+import time
+
+import numpy as np
+
+
+class DrowsinessMonitor:
+
+    def __init__(self, thresh=0.25, closed_seconds=3.0, max_gap=2.0, keep_on_no_face=False, capacity=512):
+        self.thresh = thresh
+        self.closed_seconds = closed_seconds  # US1: eyes closed for 3 seconds continuously
+        self.max_gap = max_gap  # a longer pause between samples breaks the closure streak
+        self.keep_on_no_face = keep_on_no_face
+        self.times = np.zeros(capacity)
+        self.ears = np.zeros(capacity)
+        self.head = 0  # next write position
+        self.count = 0
+        self.reset()
+
+    def reset(self):
+        self.closed_since = None
+        self.last_time = None
+        self.alarm = False
+
+    # feed one EAR sample (None when no face was found); returns True while the alarm is on
+    def update(self, ear, timestamp=None):
+        now = time.monotonic() if timestamp is None else timestamp
+        if self.last_time is not None and now - self.last_time > self.max_gap:
+            self.closed_since = None
+        self.last_time = now
+        if ear is None:  # no face
+            if not self.keep_on_no_face:
+                self.closed_since = None
+                self.alarm = False
+            return self.alarm
+        self.times[self.head] = now
+        self.ears[self.head] = ear
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+        if ear < self.thresh:
+            if self.closed_since is None:
+                self.closed_since = now
+        else:
+            self.closed_since = None
+        self.alarm = self.closed_duration(now) >= self.closed_seconds
+        return self.alarm
+
+    def closed_duration(self, now=None):
+        if self.closed_since is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self.closed_since
+
+    # (times, ears) of the samples within the last `seconds`, oldest first
+    def window(self, seconds=None):
+        idx = (self.head - self.count + np.arange(self.count)) % len(self.times)
+        times = self.times[idx]
+        ears = self.ears[idx]
+        if seconds is not None and self.count:
+            keep = times >= times[-1] - seconds
+            times, ears = times[keep], ears[keep]
+        return times, ears
@@ -0,0 +1,64 @@
+# vectorized eye / mouth aspect ratio for batches of 68-point landmarks
+# shapes are (N, 68, 2) arrays: one row per face (or per frame when replaying a session)
+# eyes-only backends (see landmark_backends) give (N, 12, 2): left eye then right eye, 68-point order
+import numpy as np
+
+# 68-point landmark index ranges (same as imutils face_utils.FACIAL_LANDMARKS_68_IDXS)
+RIGHT_EYE = slice(36, 42)
+LEFT_EYE = slice(42, 48)
+INNER_MOUTH = slice(60, 68)
+# 12-point eyes-only layout
+EYES_LEFT = slice(0, 6)
+EYES_RIGHT = slice(6, 12)
+
+
+# (left_eye, right_eye) points of one face in either layout
+def split_eyes(shape):
+    if len(shape) == 12:
+        return shape[EYES_LEFT], shape[EYES_RIGHT]
+    return shape[LEFT_EYE], shape[RIGHT_EYE]
+
+
+def _dist(a, b):
+    return np.sqrt(((a - b) ** 2).sum(axis=-1))
+
+
+# each eye is represented by 6 (x, y)-coordinates, eyes is (..., 6, 2)
+def eye_aspect_ratio(eyes):
+    eyes = np.asarray(eyes, dtype=np.float64)
+    A = _dist(eyes[..., 1, :], eyes[..., 5, :])
+    B = _dist(eyes[..., 2, :], eyes[..., 4, :])
+    C = _dist(eyes[..., 0, :], eyes[..., 3, :])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (A + B) / (2.0 * C)
+
+
+# inner lip is represented by 8 (x, y)-coordinates (points 60-67), mouths is (..., 8, 2)
+def mouth_aspect_ratio(mouths):
+    mouths = np.asarray(mouths, dtype=np.float64)
+    A = _dist(mouths[..., 1, :], mouths[..., 7, :])
+    B = _dist(mouths[..., 2, :], mouths[..., 6, :])
+    C = _dist(mouths[..., 3, :], mouths[..., 5, :])
+    D = _dist(mouths[..., 0, :], mouths[..., 4, :])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (A + B + C) / (2.0 * D)
+
+
+# compute left/right/mean EAR and MAR for all faces in one pass
+# returns four (N,) arrays: left_ear, right_ear, ear, mar (NaN for eyes-only shapes)
+def batch_ratios(shapes):
+    shapes = np.asarray(shapes, dtype=np.float64)
+    if shapes.size == 0:
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+    if shapes.ndim == 2:
+        shapes = shapes[np.newaxis]
+    if shapes.shape[1] == 12:
+        eyes = np.stack((shapes[:, EYES_LEFT], shapes[:, EYES_RIGHT]))
+        mar = np.full(shapes.shape[0], np.nan)
+    else:
+        eyes = np.stack((shapes[:, LEFT_EYE], shapes[:, RIGHT_EYE]))  # (2, N, 6, 2)
+        mar = mouth_aspect_ratio(shapes[:, INNER_MOUTH])
+    left_ear, right_ear = eye_aspect_ratio(eyes)
+    ear = (left_ear + right_ear) / 2.0
+    return left_ear, right_ear, ear, mar
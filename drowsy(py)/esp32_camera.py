@@ -0,0 +1,166 @@
+# JPEG frames from the ESP32 camera over rpc
+# the JPEG is read straight into a pooled, reusable buffer (no per-frame bytearray) and handed
+# to cv2.imdecode as a numpy view of that buffer, optionally decoded at reduced size
+#
+# streaming mode: one "jpeg_image_stream" call switches the camera to rpc stream_writer, then
+# stream_reader receives frames back to back (queue_depth frames in flight) at the camera's own
+# frame rate instead of two blocking RPC round trips per frame
+#
+# AsyncEsp32Camera does the same over rpc_async masters, for one event loop driving many cameras
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_queue import FrameQueue
+
+# decode presets: full color for the preview, half-size grayscale is enough for the face detector
+DECODE_COLOR = cv2.IMREAD_COLOR
+DECODE_GRAY = cv2.IMREAD_GRAYSCALE
+DECODE_GRAY_HALF = cv2.IMREAD_REDUCED_GRAYSCALE_2
+DECODE_COLOR_HALF = cv2.IMREAD_REDUCED_COLOR_2
+
+
+class BufferPool:
+    # round-robin set of receive buffers; a frame stays valid until `size` more frames are received
+
+    def __init__(self, size=2, capacity=20480):  # the ESP32 jpg_buf is 20KB
+        self.buffers = [bytearray(capacity) for _ in range(size)]
+        self.next = 0
+
+    def get(self, size):
+        i = self.next
+        self.next = (i + 1) % len(self.buffers)
+        if len(self.buffers[i]) < size:
+            self.buffers[i] = bytearray(size)
+        return memoryview(self.buffers[i])[:size]
+
+
+class Esp32Camera:
+
+    def __init__(self, rpc_master, pool_size=2, decode_flags=DECODE_COLOR, timeout=1000):
+        self.rpc_master = rpc_master
+        self.pool = BufferPool(pool_size)
+        self.decode_flags = decode_flags
+        self.timeout = timeout
+
+    # raw JPEG bytes (a memoryview into the pool) or None
+    def snapshot(self):
+        result = self.rpc_master.call("jpeg_image_snapshot", recv_timeout=self.timeout)
+        if result is None:
+            return None
+        jpg_sz = int.from_bytes(result, "little")
+        if not jpg_sz:
+            return None
+        buf = self.pool.get(jpg_sz)
+        self.rpc_master.call("jpeg_image_read", recv_timeout=self.timeout)
+        if self.rpc_master.read_bytes(buf, self.timeout) is None:  # counted in link_stats()
+            return None
+        return buf
+
+    # blocking: start the camera stream and call callback(jpg) for every frame until the link
+    # fails or callback raises StopStream; returns False when the camera refused to stream
+    def stream(self, callback, queue_depth=4, read_timeout=5000):
+        if self.rpc_master.call("jpeg_image_stream", recv_timeout=self.timeout) is None:
+            return False
+        try:
+            self.rpc_master.stream_reader(callback, queue_depth=queue_depth, read_timeout_ms=read_timeout)
+        except StopStream:
+            pass
+        return True
+
+    # rpc link counters: retries, crc_failures, timeouts, bytes_per_sec, srtt_ms, rto_ms, ...
+    def link_stats(self):
+        return self.rpc_master.get_stats()
+
+    # decoded frame or None
+    def read(self, flags=None):
+        jpg = self.snapshot()
+        if jpg is None:
+            return None
+        return decode(jpg, self.decode_flags if flags is None else flags)
+
+
+class AsyncEsp32Camera(Esp32Camera):
+    # the same calls on an rpc_async master; await them from one event loop for many cameras
+
+    async def snapshot(self):
+        result = await self.rpc_master.call("jpeg_image_snapshot", recv_timeout=self.timeout)
+        if result is None:
+            return None
+        jpg_sz = int.from_bytes(result, "little")
+        if not jpg_sz:
+            return None
+        buf = self.pool.get(jpg_sz)
+        await self.rpc_master.call("jpeg_image_read", recv_timeout=self.timeout)
+        if await self.rpc_master.read_bytes(buf, self.timeout) is None:
+            return None
+        return buf
+
+    # streamed JPEGs, empty when the camera refused to stream:
+    #   async with camera.frames() as frames:
+    #       async for jpg in frames: ...
+    def frames(self, queue_depth=4, read_timeout=5000):
+        return self.rpc_master.frames(queue_depth, read_timeout,
+                                      start=lambda: self.rpc_master.call("jpeg_image_stream", recv_timeout=self.timeout))
+
+    async def read(self, flags=None):
+        jpg = await self.snapshot()
+        if jpg is None:
+            return None
+        return decode(jpg, self.decode_flags if flags is None else flags)
+
+
+# decode without copying the JPEG: np.frombuffer is a view of the pooled buffer
+def decode(jpg, flags=DECODE_COLOR):
+    return cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), flags)
+
+
+class StopStream(Exception):
+    pass
+
+
+class StreamThread(threading.Thread):
+    # keeps the camera streaming into a FrameQueue (newest frame wins), restarting the stream
+    # after link errors; frames are decoded with decode_flags, or left as JPEG bytes when None
+    # a camera that has not sent a single frame after `max_refusals` stream attempts runs firmware
+    # without jpeg_image_stream (the rpc slave answers unknown calls with an empty result and never
+    # streams): the thread then ends with `unsupported` set and the queue closed, so the caller can
+    # fall back to snapshot polling
+
+    def __init__(self, camera, queue=None, queue_depth=4, decode_flags=DECODE_COLOR, max_refusals=3):
+        super().__init__(daemon=True)
+        self.camera = camera
+        self.queue = queue if queue is not None else FrameQueue(maxlen=2)
+        self.queue_depth = queue_depth
+        self.decode_flags = decode_flags
+        self.max_refusals = max_refusals
+        self.running = True
+        self.unsupported = False
+        self.frames = 0
+
+    def _on_frame(self, jpg):
+        if not self.running:
+            raise StopStream()
+        frame = bytes(jpg) if self.decode_flags is None else decode(jpg, self.decode_flags)
+        if frame is not None:
+            self.frames += 1
+            self.queue.put(frame)
+
+    def run(self):
+        refusals = 0
+        while self.running:
+            frames = self.frames
+            if self.camera.stream(self._on_frame, self.queue_depth) and self.frames > frames:
+                refusals = 0
+                continue
+            refusals += 1
+            if not self.frames and refusals >= self.max_refusals:
+                self.unsupported = True
+                break
+            time.sleep(0.5)  # camera busy
+        self.queue.close()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,276 @@
+# ESP32 camera simulator: an rpc slave that answers like src/main.cpp, without the hardware
+# serves jpeg_image_snapshot / jpeg_image_read / jpeg_image_stream (and button_read) from a folder
+# of images, paced at a camera frame rate, with optional injected latency, dropped and corrupted
+# writes. Two transports:
+#   pty      a pseudo terminal; hosts open the printed /dev/pts/N exactly like /dev/ttyACM0
+#            (rpc_usb_vcp_master, detect_n_camera.py, detection_server.py rpc:/dev/pts/N)
+#   network  an rpc_network_slave on 127.0.0.2; hosts use rpc_network_master("127.0.0.2", my_ip="127.0.0.1")
+#
+# usage: python esp32_sim.py frames/ [--transport pty] [--fps 10] [--drop 0.01] [--corrupt 0.01] [--latency 5]
+#        python esp32_sim.py frames/ --selftest 50   # snapshot + stream check against the folder, exit 1 on failure
+import argparse
+import glob
+import os
+import pty
+import random
+import select
+import struct
+import sys
+import threading
+import time
+import tty
+
+import rpc
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+SLAVE_IP = "127.0.0.2"
+MASTER_IP = "127.0.0.1"
+MAX_JPEG = 0xFFFF  # the firmware reports jpg_sz as a uint16
+
+
+class FrameSource:
+    # images of a folder in name order, looping, handed out no faster than `fps` like a free-running camera
+
+    def __init__(self, folder, fps=10.0):
+        names = sorted(f for f in glob.glob(os.path.join(folder, "*")) if f.lower().endswith(IMAGE_EXTS))
+        if not names:
+            raise ValueError("No images in %s" % folder)
+        self.frames = [load_jpeg(name) for name in names]
+        self.fps = fps
+        self.index = 0
+        self.served = 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            if self.fps:
+                wait = self.next_at - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.next_at = max(self.next_at + 1.0 / self.fps, time.monotonic())
+            jpg = self.frames[self.index]
+            self.index = (self.index + 1) % len(self.frames)
+            self.served += 1
+            return jpg
+
+
+def load_jpeg(path):
+    if path.lower().endswith((".jpg", ".jpeg")):
+        with open(path, "rb") as f:
+            jpg = f.read()
+    else:
+        import cv2
+        ok, buf = cv2.imencode(".jpg", cv2.imread(path))
+        if not ok:
+            raise ValueError("Cannot encode %s" % path)
+        jpg = buf.tobytes()
+    if len(jpg) > MAX_JPEG:
+        raise ValueError("%s is %d bytes, the camera protocol allows %d" % (path, len(jpg), MAX_JPEG))
+    return jpg
+
+
+class Faults:
+    # applied to every write of the simulated camera: fixed + random latency, then a dropped write
+    # (the host sees a timeout) or one flipped byte (the host sees a CRC failure)
+
+    def __init__(self, drop=0.0, corrupt=0.0, latency_ms=0.0, jitter_ms=0.0, seed=None):
+        self.drop = drop
+        self.corrupt = corrupt
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.dropped = 0
+        self.corrupted = 0
+
+    def apply(self, data):
+        delay = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay:
+            time.sleep(delay * 0.001)
+        r = self.random.random()
+        if r < self.drop:
+            self.dropped += 1
+            return None
+        if r < self.drop + self.corrupt and len(data):
+            data = bytearray(data)
+            data[self.random.randrange(len(data))] ^= 0xFF
+            self.corrupted += 1
+        return data
+
+
+class rpc_pty_slave(rpc.rpc_slave):
+    # rpc slave on the master side of a pseudo terminal; self.port is the device path for the host.
+    # reads follow the serial slaves: 10ms for the first byte, 1s per chunk inside a stream
+
+    def __init__(self):
+        self.__fd, self.__peer_fd = pty.openpty()  # keeping the peer open avoids EIO between host sessions
+        tty.setraw(self.__fd)
+        tty.setraw(self.__peer_fd)
+        self.port = os.ttyname(self.__peer_fd)
+        rpc.rpc_slave.__init__(self)
+
+    def __read(self, buff, first_timeout, timeout):
+        view = memoryview(buff)
+        i = 0
+        while i < len(view):
+            if not select.select([self.__fd], [], [], first_timeout if not i else timeout)[0]: return None
+            i += os.readv(self.__fd, [view[i:]])
+        return buff
+
+    def __write(self, data, timeout_ms):
+        view = memoryview(data)
+        while len(view):
+            if not select.select([], [self.__fd], [], max(timeout_ms, 1) * 0.001)[1]: return False
+            view = view[os.write(self.__fd, view):]
+        return True
+
+    def _flush(self): # protected
+        while select.select([self.__fd], [], [], 0)[0]:
+            os.read(self.__fd, 65536)
+
+    def get_bytes(self, buff, timeout_ms): # protected
+        return self.__read(buff, 0.01, 0.01)
+
+    def put_bytes(self, data, timeout_ms): # protected
+        self.__write(data, timeout_ms)
+
+    def _stream_get_bytes(self, buff, timeout_ms): # protected
+        return self.__read(buff, 1, 1)
+
+    def _stream_put_bytes(self, data, timeout_ms): # protected
+        if not self.__write(data, timeout_ms): raise OSError # Stop Stream.
+
+
+class CameraSim:
+    # the firmware's rpc callbacks on top of any rpc slave transport
+
+    def _camera_init(self, source, faults=None):
+        self.source = source
+        self.faults = faults or Faults()
+        self.jpg = bytes()
+        for cb in (self.button_read, self.jpeg_image_snapshot, self.jpeg_image_read, self.jpeg_image_stream):
+            self.register_callback(cb)
+
+    def put_bytes(self, data, timeout_ms):
+        data = self.faults.apply(data)
+        if data is not None:
+            super().put_bytes(data, timeout_ms)
+
+    def _stream_put_bytes(self, data, timeout_ms):
+        data = self.faults.apply(data)
+        if data is not None:
+            super()._stream_put_bytes(data, timeout_ms)
+
+    def button_read(self, data):
+        return struct.pack("<B", 0)
+
+    def jpeg_image_snapshot(self, data):
+        self.jpg = self.source.next()
+        return struct.pack("<H", len(self.jpg))
+
+    # like the firmware's read_flag: the JPEG goes out raw right after the (empty) result
+    def jpeg_image_read(self, data):
+        self.schedule_callback(lambda: self.write_bytes(self.jpg, 10000))
+        return bytes()
+
+    def jpeg_image_stream(self, data):
+        self.schedule_callback(lambda: self.stream_writer(self.source.next, 10000))
+        return bytes()
+
+    def serve_forever(self):
+        thread = threading.Thread(target=self.loop, daemon=True)
+        thread.start()
+        return thread
+
+
+class PtyCamera(CameraSim, rpc_pty_slave):
+
+    def __init__(self, source, faults=None):
+        rpc_pty_slave.__init__(self)
+        self._camera_init(source, faults)
+
+
+class NetworkCamera(CameraSim, rpc.rpc_network_slave):
+
+    def __init__(self, source, faults=None, my_ip=SLAVE_IP, port=0x1DBA):
+        rpc.rpc_network_slave.__init__(self, my_ip=my_ip, port=port)
+        self._camera_init(source, faults)
+
+
+def make_camera(transport, source, faults=None, port=0x1DBA):
+    if transport == "pty":
+        return PtyCamera(source, faults)
+    if transport == "network":
+        return NetworkCamera(source, faults, port=port)
+    raise ValueError("Unknown transport %r, choose pty or network" % transport)
+
+
+def make_master(transport, camera, port=0x1DBA):
+    if transport == "pty":
+        return rpc.rpc_usb_vcp_master(camera.port)
+    return rpc.rpc_network_master(SLAVE_IP, my_ip=MASTER_IP, port=port)
+
+
+# snapshots (and a short stream) through the real host-side camera code, compared with the folder
+def selftest(transport, camera, frames, port=0x1DBA):
+    from esp32_camera import Esp32Camera, StopStream
+    master = make_master(transport, camera, port)
+    cam = Esp32Camera(master)
+    known = set(camera.source.frames)
+    ok = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        jpg = cam.snapshot()
+        ok += jpg is not None and bytes(jpg) in known
+    seconds = time.perf_counter() - start
+    print(f'snapshot {ok}/{frames} intact  {ok / seconds:.1f} FPS')
+    print(master.get_stats())
+    streamed = []
+
+    def on_frame(jpg):
+        streamed.append(bytes(jpg) in known)
+        if len(streamed) >= frames:
+            raise StopStream()
+
+    start = time.perf_counter()
+    cam.stream(on_frame)
+    seconds = time.perf_counter() - start
+    print(f'stream   {sum(streamed)}/{frames} intact  {len(streamed) / seconds:.1f} FPS')
+    print(f'injected: {camera.faults.dropped} dropped, {camera.faults.corrupted} corrupted writes')
+    return ok, sum(streamed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated ESP32 camera rpc slave")
+    parser.add_argument("folder", help="folder of JPEG (or PNG/BMP) frames")
+    parser.add_argument("--transport", choices=["pty", "network"], default="pty")
+    parser.add_argument("--port", type=int, default=0x1DBA, help="network port")
+    parser.add_argument("--fps", type=float, default=10.0, help="camera frame rate, 0 = unlimited")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of dropping a write")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability of corrupting a write")
+    parser.add_argument("--latency", type=float, default=0.0, help="added latency per write in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency per write in ms")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--selftest", type=int, default=0, metavar="N", help="check N frames and exit")
+    args = parser.parse_args(argv)
+
+    faults = Faults(args.drop, args.corrupt, args.latency, args.jitter, args.seed)
+    camera = make_camera(args.transport, FrameSource(args.folder, args.fps), faults, args.port)
+    camera.serve_forever()
+    if args.selftest:
+        snapshots, streamed = selftest(args.transport, camera, args.selftest, args.port)
+        # with injected faults frames may be lost, or damaged (the raw JPEG transfer carries no CRC)
+        lossy = args.drop or args.corrupt
+        return 0 if lossy or (snapshots == streamed == args.selftest) else 1
+    print(camera.port if args.transport == "pty" else "rpc_network_master(%r, my_ip=%r, port=%d)" % (SLAVE_IP, MASTER_IP, args.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print(f'{camera.source.served} frames served, {faults.dropped} dropped / {faults.corrupted} corrupted writes')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# face tracking mode: run the HOG face detector only on keyframes (or when tracking is lost)
+# and seed the shape_predictor from a tracked rectangle on the frames in between
+#
+# detection pyramid: the detector runs on downscaled copies of the frame (smallest scale first,
+# falling back to larger scales when no face is found) and the rectangles are mapped back to the
+# native resolution, so the 68-point shape_predictor only samples the face ROI of the full-res frame
+import cv2
+import dlib
+import numpy as np
+
+from landmark_backends import Dlib68Backend, get_backend
+
+TRACK_CORRELATION = "correlation"  # dlib.correlation_tracker per face
+TRACK_LANDMARKS = "landmarks"  # shift the previous rectangle with the landmark centroid
+
+
+class FaceTracker:
+
+    def __init__(self, detector=None, predictor=None, keyframe_interval=10, min_confidence=7.0,
+                 mode=TRACK_CORRELATION, upsample=0, detect_scales=(1.0,), backend=None):
+        # backend: a landmark_backends instance or name; default is dlib HOG + 68 points, with
+        # detector / predictor loaded from model_registry on first use unless given here
+        if backend is None:
+            backend = Dlib68Backend(detector, predictor)
+        elif isinstance(backend, str):
+            backend = get_backend(backend)
+        self.backend = backend
+        self.keyframe_interval = max(1, keyframe_interval)  # 1 --> detect on every frame (old behaviour)
+        self.min_confidence = min_confidence  # peak-to-side-lobe ratio below which a track is dropped
+        self.mode = mode
+        self.upsample = upsample
+        self.detect_scales = sorted(detect_scales)  # e.g. (0.25, 0.5) --> detector cost drops ~scale^2
+        self.detector_runs = 0
+        self.frames = 0
+        self.reset()
+
+    def reset(self):
+        self.rects = []
+        self.trackers = []
+        self.offsets = []  # landmark mode: rect center - landmark centroid at the keyframe
+        self.since_keyframe = 0
+
+    def _detect(self, gray):
+        self.detector_runs += 1
+        self.rects = detect_faces(self.backend.detect, gray, self.detect_scales, self.upsample)
+        self.trackers = []
+        self.offsets = []
+        if self.mode == TRACK_CORRELATION:
+            for rect in self.rects:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(gray, rect)
+                self.trackers.append(tracker)
+        self.since_keyframe = 0
+        return self.rects
+
+    def _track(self, gray):
+        # returns None when any face lost track so the caller falls back to the detector
+        if self.mode != TRACK_CORRELATION:
+            return self.rects
+        rects = []
+        for tracker in self.trackers:
+            if tracker.update(gray) < self.min_confidence:
+                return None
+            pos = tracker.get_position()
+            rects.append(dlib.rectangle(int(pos.left()), int(pos.top()), int(pos.right()), int(pos.bottom())))
+        return rects
+
+    # face rectangles for this frame (detected on keyframes, tracked otherwise)
+    def update(self, gray):
+        self.frames += 1
+        rects = None
+        if self.rects and self.since_keyframe < self.keyframe_interval - 1:
+            rects = self._track(gray)
+        if rects is None:
+            return self._detect(gray)
+        self.since_keyframe += 1
+        self.rects = rects
+        return rects
+
+    # face rectangles and their (N, K, 2) landmarks for this frame (K = 68, or 12 for eyes-only backends)
+    def landmarks(self, gray):
+        rects = self.update(gray)
+        keyframe = self.since_keyframe == 0
+        shapes = np.array([self.backend.predict(gray, rect) for rect in rects])
+        if self.mode == TRACK_LANDMARKS and len(rects):
+            centroids = shapes.mean(axis=1)
+            if keyframe or len(self.offsets) != len(rects):
+                self.offsets = [np.array(rect_center(rect)) - c for rect, c in zip(rects, centroids)]
+            else:
+                # move each rectangle with its face so the next predict call is seeded correctly
+                self.rects = [move_rect(rect, c + off) for rect, c, off in zip(rects, centroids, self.offsets)]
+        return rects, shapes
+
+
+# run the detector over a pyramid of scales and return rectangles in native-resolution coordinates
+def detect_faces(detector, gray, scales=(1.0,), upsample=0):
+    rects = []
+    for scale in scales:
+        if scale == 1.0:
+            return list(detector(gray, upsample))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        rects = [scale_rect(rect, 1.0 / scale) for rect in detector(small, upsample)]
+        if rects:
+            break
+    return rects
+
+
+def scale_rect(rect, factor):
+    return dlib.rectangle(int(rect.left() * factor), int(rect.top() * factor),
+                          int(rect.right() * factor), int(rect.bottom() * factor))
+
+
+def rect_center(rect):
+    return ((rect.left() + rect.right()) / 2.0, (rect.top() + rect.bottom()) / 2.0)
+
+
+def move_rect(rect, center):
+    half_w = rect.width() / 2.0
+    half_h = rect.height() / 2.0
+    return dlib.rectangle(int(center[0] - half_w), int(center[1] - half_h),
+                          int(center[0] + half_w), int(center[1] + half_h))
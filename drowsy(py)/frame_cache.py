@@ -0,0 +1,62 @@
+# small LRU cache of detection results keyed by a hash of the frame
+# a stalled ESP32 camera (or a parked car) keeps sending the same picture; looking the frame up
+# here skips the detector and the predictor and reuses the previous landmarks / EAR.
+#
+# keys:
+#   exact_key(data)  blake2b of the bytes: the JPEG as received (~20KB, a few us) or a decoded
+#                    frame. Only byte-identical frames hit, so the result is always the same.
+#   phash_key(gray)  difference hash of a thumbnail; also hits on frames that differ only by
+#                    JPEG / sensor noise. Coarse: a slow eyelid movement can keep the same hash,
+#                    so use a large hash_size when the EAR matters.
+import hashlib
+from collections import OrderedDict
+
+
+def exact_key(data):
+    return hashlib.blake2b(memoryview(data), digest_size=16).digest()
+
+
+def phash_key(gray, hash_size=16):
+    import cv2
+    import numpy as np
+    thumb = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return np.packbits(thumb[:, 1:] > thumb[:, :-1]).tobytes()
+
+
+class FrameCache:
+
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self.entries), "hit_rate": round(self.hit_rate(), 3)}
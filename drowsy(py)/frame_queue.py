@@ -0,0 +1,67 @@
+# decoupled capture stage: a thread reads the camera as fast as it delivers frames into a
+# bounded ring buffer that drops the oldest frame when full, so inference always works on the
+# newest frame and the eye-closure -> buzzer latency stays bounded when inference is slow
+import threading
+import time
+from collections import deque
+
+
+class FrameQueue:
+
+    def __init__(self, maxlen=2):
+        self.frames = deque(maxlen=maxlen)  # (frame, monotonic capture time)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.captured = 0
+        self.dropped = 0  # frames that were never analyzed
+
+    def put(self, frame, timestamp=None):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append((frame, time.monotonic() if timestamp is None else timestamp))
+            self.captured += 1
+            self.cond.notify()
+
+    # newest frame and its capture time; older queued frames are discarded
+    # returns (None, None) on timeout or once the queue is closed and empty
+    def get_latest(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames or self.closed, timeout):
+                return None, None
+            if not self.frames:
+                return None, None
+            frame, timestamp = self.frames.pop()
+            self.dropped += len(self.frames)
+            self.frames.clear()
+            return frame, timestamp
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class CaptureThread(threading.Thread):
+
+    def __init__(self, cap, queue):
+        super().__init__(daemon=True)
+        self.cap = cap  # anything with read() -> (ret, frame), e.g. cv2.VideoCapture
+        self.queue = queue
+        self.running = True
+
+    def run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            self.queue.put(frame)
+        self.queue.close()
+
+    def stop(self):
+        self.running = False
+
+
+# seconds between capture and now
+def frame_age(timestamp):
+    return time.monotonic() - timestamp
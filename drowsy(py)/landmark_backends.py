@@ -0,0 +1,182 @@
+# pluggable face detect / landmark backends
+# every backend has the same two calls used by FaceTracker:
+#   detect(gray, upsample=0) -> list of dlib.rectangle
+#   predict(gray, rect)      -> (K, 2) landmarks: 68 points, or 12 eye points (left eye then
+#                               right eye, each in the 68-point order) for the eyes-only backends
+# pick one at runtime with get_backend(name); compare them with `benchmark.py --backend ...`
+import os
+
+import cv2
+import dlib
+import numpy as np
+from imutils import face_utils
+
+import model_registry
+
+PREDICTOR_5 = "models/shape_predictor_5_face_landmarks.dat"
+ONNX_LANDMARKS = "models/landmarks_68.onnx"
+# the LBP face cascade is not in the opencv-python wheel (only haarcascades are): models/ first,
+# then next to the wheel's data and the system OpenCV data directories
+LBP_FACE_CASCADE_NAME = "lbpcascade_frontalface_improved.xml"
+LBP_FACE_CASCADE_DIRS = ["models",
+                         os.path.join(os.path.dirname(os.path.normpath(cv2.data.haarcascades)), "lbpcascades"),
+                         "/usr/share/opencv4/lbpcascades", "/usr/share/opencv/lbpcascades",
+                         "/usr/local/share/opencv4/lbpcascades"]
+
+
+def require_file(path, what):
+    if not os.path.isfile(path):
+        raise FileNotFoundError("%s not found at %s" % (what, path))
+    return path
+
+
+def find_lbp_cascade():
+    for folder in LBP_FACE_CASCADE_DIRS:
+        path = os.path.join(folder, LBP_FACE_CASCADE_NAME)
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError("%s not found in %s; download it from opencv/data/lbpcascades into models/"
+                            % (LBP_FACE_CASCADE_NAME, ", ".join(LBP_FACE_CASCADE_DIRS)))
+
+
+# six eye points with EAR == opening / width: 0 & 3 are the corners, 1 & 2 the upper lid, 5 & 4 the lower lid
+def eye_points(corner_a, corner_b, opening):
+    a = np.asarray(corner_a, dtype=np.float64)
+    b = np.asarray(corner_b, dtype=np.float64)
+    along = b - a
+    width = np.hypot(*along)
+    normal = np.array([-along[1], along[0]]) / width if width else np.array([0.0, 1.0])
+    half = normal * (opening / 2.0)
+    p1, p2 = a + along / 3.0 - half, a + along * 2.0 / 3.0 - half
+    p5, p4 = a + along / 3.0 + half, a + along * 2.0 / 3.0 + half
+    return np.array([a, p1, p2, b, p4, p5])
+
+
+def to_rect(x, y, w, h):
+    return dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
+
+
+class Dlib68Backend:
+    # HOG detector + 68-point shape predictor (the original pipeline)
+    name = "dlib68"
+
+    def __init__(self, detector=None, predictor=None, predictor_path=model_registry.PREDICTOR_68):
+        self._detector = detector  # None --> model_registry on first use
+        self._predictor = predictor
+        self.predictor_path = predictor_path
+
+    def detect(self, gray, upsample=0):
+        if self._detector is None:
+            self._detector = model_registry.get_detector()
+        return list(self._detector(gray, upsample))
+
+    def predict(self, gray, rect):
+        if self._predictor is None:
+            self._predictor = model_registry.get_predictor(self.predictor_path)
+        return face_utils.shape_to_np(self._predictor(gray, rect))
+
+
+class Dlib5Backend(Dlib68Backend):
+    # HOG detector + 5-point predictor (~9MB, much faster) for the eye corners; the lid opening is
+    # measured on an eye crop as the height of the dark (Otsu) band between the corners
+    name = "dlib5"
+
+    def __init__(self, detector=None, predictor=None, predictor_path=PREDICTOR_5):
+        super().__init__(detector, predictor, predictor_path)
+        if predictor is None:
+            require_file(predictor_path, "5-point shape predictor")
+
+    def _opening(self, gray, a, b):
+        width = np.hypot(*(b - a))
+        cx, cy = (a + b) / 2.0
+        x0, x1 = int(cx - width * 0.3), int(cx + width * 0.3)  # middle of the eye, away from the corners
+        y0, y1 = int(cy - width * 0.5), int(cy + width * 0.5)
+        crop = gray[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)]
+        if crop.size == 0:
+            return 0.0
+        _, mask = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        dark_rows = np.count_nonzero(mask, axis=1) > mask.shape[1] * 0.5
+        return float(dark_rows.sum())
+
+    def predict(self, gray, rect):
+        pts = super().predict(gray, rect).astype(np.float64)
+        eyes = []
+        for a, b in ((pts[0], pts[1]), (pts[2], pts[3])):  # left eye corners, right eye corners
+            a, b = (a, b) if a[0] < b[0] else (b, a)
+            eyes.append(eye_points(a, b, self._opening(gray, a, b)))
+        return np.concatenate(eyes)
+
+
+class HaarBackend:
+    # OpenCV cascades: face cascade for detection, eye cascade inside the upper half of the face.
+    # the eye cascade only fires on open eyes, so a found eye gets EAR = open_ear and a missing one 0
+    name = "haar"
+
+    def __init__(self, face_cascade=None, eye_cascade=None, open_ear=0.3, min_face=60):
+        self.face_cascade = face_cascade or cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.eye_cascade = eye_cascade or cv2.data.haarcascades + "haarcascade_eye.xml"
+        self.open_ear = open_ear
+        self.min_face = min_face
+
+    def detect(self, gray, upsample=0):
+        faces = model_registry.get_cascade(self.face_cascade).detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(self.min_face, self.min_face))
+        return [to_rect(*face) for face in faces]
+
+    def predict(self, gray, rect):
+        x, y, w, h = rect.left(), rect.top(), rect.width(), rect.height()
+        roi = gray[max(y, 0):max(y + h // 2, 0), max(x, 0):max(x + w, 0)]
+        found = model_registry.get_cascade(self.eye_cascade).detectMultiScale(roi, scaleFactor=1.1, minNeighbors=5)
+        # default eye boxes from face proportions, replaced by detections (image-left box is the right eye)
+        right = [x + w * 0.2, y + h * 0.38, w * 0.2, None]
+        left = [x + w * 0.6, y + h * 0.38, w * 0.2, None]
+        for ex, ey, ew, eh in sorted(found, key=lambda e: e[2] * e[3], reverse=True):
+            box = right if ex + ew / 2.0 < w / 2.0 else left
+            if box[3] is None:  # keep the largest detection on each side
+                box[:] = [x + ex, y + ey + eh / 2.0, ew, ew]
+        eyes = []
+        for ex, ey, ew, seen in (left, right):
+            opening = self.open_ear * ew if seen is not None else 0.0
+            eyes.append(eye_points((ex, ey), (ex + ew, ey), opening))
+        return np.concatenate(eyes)
+
+
+class OnnxBackend(Dlib68Backend):
+    # HOG detector + a 68-point landmark regression model run with onnxruntime on the CPU.
+    # the model takes a face crop (NCHW, [0, 1]) and returns 136 coordinates normalized to the crop;
+    # dynamic input dims (None or a symbolic name) are taken from input_shape (channels, height, width)
+    name = "onnx"
+
+    def __init__(self, model_path=ONNX_LANDMARKS, detector=None, input_shape=(3, 112, 112)):
+        super().__init__(detector)
+        self.model_path = require_file(model_path, "ONNX landmark model")
+        self.input_shape = input_shape
+
+    def predict(self, gray, rect):
+        session = model_registry.get_onnx_session(self.model_path)
+        inp = session.get_inputs()[0]
+        channels, height, width = [dim if isinstance(dim, int) and dim > 0 else default
+                                   for dim, default in zip(inp.shape[1:], self.input_shape)]
+        x0, y0 = max(rect.left(), 0), max(rect.top(), 0)
+        x1, y1 = min(rect.right(), gray.shape[1]), min(rect.bottom(), gray.shape[0])
+        crop = cv2.resize(gray[y0:y1, x0:x1], (width, height))
+        if channels == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR).transpose(2, 0, 1)
+        blob = (crop.astype(np.float32) / 255.0).reshape(1, channels, height, width)
+        out = session.run(None, {inp.name: blob})[0].reshape(-1, 2)
+        return out * [x1 - x0, y1 - y0] + [x0, y0]
+
+
+BACKENDS = {
+    "dlib68": Dlib68Backend,
+    "dlib5": Dlib5Backend,
+    "haar": HaarBackend,
+    "lbp": lambda **kwargs: HaarBackend(face_cascade=find_lbp_cascade(), **kwargs),
+    "onnx": OnnxBackend,
+}
+
+
+def get_backend(name="dlib68", **kwargs):
+    if name not in BACKENDS:
+        raise ValueError("Unknown landmark backend %r, choose from %s" % (name, ", ".join(BACKENDS)))
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,93 @@
+# lazy model registry
+# models (dlib face detector, the ~100MB 68-point shape predictor) and the pygame mixer are
+# loaded on first use and cached per process. For worker pools, mp_context() preloads them once
+# in a parent (fork) or in the forkserver process, so every worker shares the pages copy-on-write
+# instead of loading its own copy.
+import multiprocessing
+import os
+import threading
+
+PREDICTOR_68 = "models/shape_predictor_68_face_landmarks.dat"
+PRELOAD_ENV = "DROWSY_PRELOAD_MODELS"  # set --> preload when this module is imported (forkserver)
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _get(key, loader):
+    model = _cache.get(key)
+    if model is None:
+        with _lock:
+            model = _cache.get(key)
+            if model is None:
+                model = loader()
+                _cache[key] = model
+    return model
+
+
+def get_detector():
+    import dlib
+    return _get(("detector",), dlib.get_frontal_face_detector)
+
+
+def get_predictor(path=PREDICTOR_68):
+    import dlib
+    return _get(("predictor", os.path.abspath(path)), lambda: dlib.shape_predictor(path))
+
+
+def get_cascade(path):
+    import cv2
+
+    def load():
+        cascade = cv2.CascadeClassifier(path)
+        if cascade.empty():  # OpenCV returns an empty classifier instead of failing
+            raise FileNotFoundError("Cannot load cascade %s" % path)
+        return cascade
+    return _get(("cascade", os.path.abspath(path)), load)
+
+
+# CPU-only onnxruntime session; onnxruntime is only needed for the onnx landmark backend
+def get_onnx_session(path):
+    def load():
+        import onnxruntime
+        return onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+    return _get(("onnx", os.path.abspath(path)), load)
+
+
+# pygame mixer with the alarm sound loaded, initialized on the first alarm only
+def get_mixer(sound="music.wav"):
+    def load():
+        from pygame import mixer
+        mixer.init()
+        mixer.music.load(sound)
+        return mixer
+    return _get(("mixer", os.path.abspath(sound)), load)
+
+
+def loaded():
+    return list(_cache)
+
+
+def preload(predictor_path=PREDICTOR_68):
+    get_detector()
+    get_predictor(predictor_path)
+
+
+# multiprocessing context whose workers start with the models already in memory;
+# predictor_path=None preloads nothing (backends that do not use the dlib models)
+def mp_context(method="forkserver", predictor_path=PREDICTOR_68):
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    ctx = multiprocessing.get_context(method)
+    if predictor_path is None:
+        return ctx
+    if method == "fork":
+        preload(predictor_path)  # children inherit the parent's pages
+    elif method == "forkserver":
+        os.environ[PRELOAD_ENV] = predictor_path  # read by the forkserver when it imports us
+        ctx.set_forkserver_preload([__name__])
+    return ctx
+
+
+if os.environ.get(PRELOAD_ENV):
+    preload(os.environ[PRELOAD_ENV])
@@ -0,0 +1,75 @@
+# motion gate: skip landmark inference while the eyes do not move
+# after each inference the eye region (all eye landmarks plus a margin) of that frame is kept as
+# the reference; following frames only rerun detect + landmarks when the mean absolute pixel
+# difference inside that region exceeds the threshold, otherwise the last EAR is reused.
+# Comparing with the last *inferred* frame (not just the previous one) means a slow eyelid
+# movement still adds up and trips the gate. max_skip_seconds bounds how stale a reused EAR can be.
+#
+# the caller keeps feeding the reused EAR to DrowsinessMonitor with each frame's own timestamp,
+# so a closure keeps accumulating real time while frames are skipped.
+import cv2
+import numpy as np
+
+import ear
+
+
+class MotionGate:
+
+    def __init__(self, threshold=4.0, max_skip_seconds=1.0, margin=0.5):
+        self.threshold = threshold  # mean |difference| in gray levels (0-255)
+        self.max_skip_seconds = max_skip_seconds
+        self.margin = margin  # padding around the eyes, as a fraction of the eye box size
+        self.box = None  # (x0, y0, x1, y1) of the eye region, None without a face
+        self.reference = None
+        self.last_run = None
+        self.last_diff = None
+        self.frames = 0
+        self.skipped = 0
+
+    def reset(self):
+        self.box = None
+        self.reference = None
+        self.last_run = None
+
+    # True when landmarks must be recomputed for this frame
+    def should_run(self, gray, now):
+        self.frames += 1
+        if self.reference is None or now - self.last_run >= self.max_skip_seconds:
+            return True
+        x0, y0, x1, y1 = self.box
+        roi = gray[y0:y1, x0:x1]
+        if roi.shape != self.reference.shape:  # frame size changed
+            return True
+        self.last_diff = float(cv2.absdiff(roi, self.reference).mean())
+        if self.last_diff > self.threshold:
+            return True
+        self.skipped += 1
+        return False
+
+    # after an inference: the eye region of these landmarks becomes the new reference
+    def update(self, gray, shapes, now):
+        self.last_run = now
+        self.box = eye_region(shapes, gray.shape, self.margin)
+        if self.box is None:
+            self.reference = None  # no face: no gating, every frame runs the detector
+            return
+        x0, y0, x1, y1 = self.box
+        self.reference = gray[y0:y1, x0:x1].copy()
+
+    def skip_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+
+# bounding box (x0, y0, x1, y1) of the eyes of every face, padded by margin and clipped to the frame
+def eye_region(shapes, frame_shape, margin=0.5):
+    if len(shapes) == 0:
+        return None
+    points = np.concatenate([np.concatenate(ear.split_eyes(shape)) for shape in shapes])
+    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+    pad_x, pad_y = (x1 - x0) * margin, (y1 - y0) * margin + 1
+    height, width = frame_shape[:2]
+    x0, y0 = int(max(x0 - pad_x, 0)), int(max(y0 - pad_y, 0))
+    x1, y1 = int(min(x1 + pad_x, width)), int(min(y1 + pad_y, height))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
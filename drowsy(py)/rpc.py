@@ -5,7 +5,10 @@
 #
 # This work is licensed under the MIT license, see the file LICENSE for details.
 
-import gc, serial, socket, struct, time
+import gc, serial, socket, struct, sys, time
+
+try: from binascii import crc_hqx # CRC-16/CCITT in C, same polynomial and table as below.
+except ImportError: crc_hqx = None # MicroPython.
 
 class rpc:
 
@@ -14,6 +17,13 @@ class rpc:
     _RESULT_HEADER_PACKET_MAGIC = 0x9021
     _RESULT_DATA_PACKET_MAGIC = 0x1DBA
 
+    # On a host (CPython/PyPy) forced gc.collect() and per-call buffer allocations cost more than they
+    # save, so masters skip collection and build/receive packets in reusable buffers instead.
+    _host_mode = sys.implementation.name != "micropython"
+    _zeros = memoryview(bytes(64))
+    # The network transports wait short timeouts * _timeout_scale ms; RTT estimates are divided by it.
+    _timeout_scale = 1
+
     def __def_crc_16(self, data, size): # private
         crc = 0xFFFF
         for i in range(size):
@@ -56,11 +66,18 @@ class rpc:
 
     def __tab_crc_16(self, data, size): # private
         crc = 0xFFFF
-        for i in range(size): crc = self.__crc_16_table[((crc >> 8) ^ data[i]) & 0xff] ^ (crc << 8)
-        return crc & 0xFFFF
+        table = self.__crc_16_table # Bind locally, no attribute lookup per byte.
+        # Mask every step so crc stays a small int instead of growing 8 bits per byte.
+        for b in memoryview(data)[:size]: crc = table[(crc >> 8) ^ b] ^ ((crc << 8) & 0xFF00)
+        return crc
+
+    def __fast_crc_16(self, data, size): # private
+        return crc_hqx(memoryview(data)[:size], 0xFFFF)
 
     def _zero(self, buff, size): # private
-        for i in range(size): buff[i] = 0
+        if self._host_mode and size <= len(self._zeros): buff[:size] = self._zeros[:size]
+        else:
+            for i in range(size): buff[i] = 0
 
     def _same(self, data, size): # private
         if not size: return False
@@ -79,22 +96,92 @@ class rpc:
         return h & 0xFFFFFFFF
 
     def __init__(self): # private
-        self.__crc_16 = self.__tab_crc_16
+        self.__crc_16 = self.__fast_crc_16 if crc_hqx is not None else self.__tab_crc_16
         self._stream_writer_queue_depth_max = 255
+        self._srtt = None
+        self._rttvar = 0
+        self._backoff_rto = None
+        self._last_rto = None
+        self.reset_stats()
+
+    # Link quality counters. crc_failures counts packets with a bad magic value or CRC, timeouts
+    # counts packets that did not arrive (completely) in time.
+    def reset_stats(self): # public
+        self._stats = {"calls": 0, "failed_calls": 0, "retries": 0, "timeouts": 0, "crc_failures": 0,
+                       "bytes_sent": 0, "bytes_received": 0, "since": time.time()}
+
+    def get_stats(self): # public
+        stats = dict(self._stats)
+        stats["seconds"] = max(time.time() - stats.pop("since"), 0.000001)
+        stats["bytes_per_sec"] = (stats["bytes_sent"] + stats["bytes_received"]) / stats["seconds"]
+        stats["srtt_ms"] = self._srtt
+        stats["rttvar_ms"] = self._rttvar if self._srtt is not None else None
+        stats["rto_ms"] = self._last_rto
+        return stats
+
+    # TCP style round trip estimator (RFC 6298): fed only with exchanges that were not retried (Karn).
+    # A sample ends any backoff (5.7).
+    def _rtt_sample(self, rtt): # protected
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt / 2
+        else:
+            self._rttvar = (0.75 * self._rttvar) + (0.25 * abs(self._srtt - rtt))
+            self._srtt = (0.875 * self._srtt) + (0.125 * rtt)
+        self._backoff_rto = None
+
+    # First short timeout of an exchange: SRTT + 4 * RTTVAR in whole (scaled) ms, between floor and
+    # limit, or the backed off timeout of an earlier exchange until a new sample arrives (5.5 / 5.7).
+    # Resetting to the estimate on every call would time out the first attempt again and again, and
+    # by Karn's rule such a link never yields a sample. backed_off=False starts from the estimate.
+    def _rto(self, floor, limit, backed_off=True): # protected
+        if backed_off and self._backoff_rto is not None: rto = max(self._backoff_rto, floor)
+        elif self._srtt is None: rto = floor
+        else: rto = max(int((self._srtt + (4 * self._rttvar)) / self._timeout_scale) + 1, floor)
+        self._last_rto = min(rto, limit)
+        return self._last_rto
+
+    # Doubles a short timeout after a failed attempt and keeps it for the next exchanges, bounded to
+    # limit / 32 (2.5 allows a maximum) so a later call still gets several attempts: the slave only
+    # listens between its own flushes, so a long wait for one lost packet costs more than a resend.
+    def _back_off(self, rto, limit): # protected
+        self._last_rto = min(rto * 2, limit)
+        self._backoff_rto = min(self._last_rto, limit // 32)
+        return self._last_rto
 
     def _get_packet_pre_alloc(self, payload_len=0):
         buff = bytearray(payload_len + 4)
         return (buff, memoryview(buff)[2:-2])
 
+    def _valid_packet(self, magic_value, packet): # protected
+        magic = packet[0] | (packet[1] << 8)
+        crc = packet[-2] | (packet[-1] << 8)
+        return magic == magic_value and crc == self.__crc_16(packet, len(packet) - 2)
+
     def _get_packet(self, magic_value, payload_buf_tuple, timeout): # private
         packet = self.get_bytes(payload_buf_tuple[0], timeout)
-        if packet is not None:
-            magic = packet[0] | (packet[1] << 8)
-            crc = packet[-2] | (packet[-1] << 8)
-            if magic == magic_value and crc == self.__crc_16(packet, len(packet) - 2):
-                return payload_buf_tuple[1]
+        if packet is None: self._stats["timeouts"] += 1
+        elif self._valid_packet(magic_value, packet):
+            self._stats["bytes_received"] += len(packet)
+            return payload_buf_tuple[1]
+        else: self._stats["crc_failures"] += 1
         return None
 
+    # put_bytes returns False when the transport knows the write failed (serial writes return None).
+    def _send(self, data, timeout_ms): # protected
+        if self.put_bytes(data, timeout_ms) is not False: self._stats["bytes_sent"] += len(data)
+
+    # Raw transfers outside the packet protocol (e.g. the JPEG following jpeg_image_read), counted in
+    # the link stats like the packets are.
+    def read_bytes(self, buff, timeout_ms): # public
+        data = self.get_bytes(buff, timeout_ms)
+        if data is None: self._stats["timeouts"] += 1
+        else: self._stats["bytes_received"] += len(data)
+        return data
+
+    def write_bytes(self, data, timeout_ms): # public
+        self._send(data, timeout_ms)
+
     def _set_packet(self, magic_value, payload=bytes()): # private
         new_payload = bytearray(len(payload) + 4)
         new_payload[:2] = struct.pack("<H", magic_value)
@@ -104,6 +191,16 @@ class rpc:
         new_payload[-2:] = struct.pack("<H", self.__crc_16(new_payload, len(payload) + 2))
         return new_payload
 
+    # Host mode: build the packet in buff (large enough) and return a view of it, no allocation.
+    def _set_packet_into(self, buff, magic_value, payload=bytes()): # private
+        if isinstance(payload, str): payload = payload.encode()
+        size = len(payload) + 4
+        view = memoryview(buff)[:size]
+        struct.pack_into("<H", buff, 0, magic_value)
+        view[2:-2] = payload
+        struct.pack_into("<H", buff, size - 2, self.__crc_16(view, size - 2))
+        return view
+
     def _flush(self): # protected
         pass
 
@@ -125,6 +222,7 @@ class rpc:
             if magic != 0x542E and crc != self.__crc_16(packet, len(packet) - 2): return
             data = self._stream_get_bytes(bytearray(struct.unpack("<I", packet[2:-2])[0]), read_timeout_ms)
             if data is None: return
+            self._stats["bytes_received"] += len(packet) + len(data)
             call_back(data)
             try: self._stream_put_bytes(struct.pack("<B", tx_lfsr), 1000)
             except OSError: return
@@ -168,55 +266,92 @@ class rpc_master(rpc):
         self.__out_result_header_ack = self._set_packet(self._RESULT_HEADER_PACKET_MAGIC)
         self.__in_result_header_buf = self._get_packet_pre_alloc(4)
         self.__out_result_data_ack = self._set_packet(self._RESULT_DATA_PACKET_MAGIC)
+        # Host mode buffers, reused by every call (grown when a bigger payload comes along).
+        self.__out_header_buf = bytearray(12)
+        self.__out_data_buf = bytearray(256)
+        self.__in_result_data_pool = bytearray(256)
         self._put_short_timeout_reset = 3
         self._get_short_timeout_reset = 3
         self._put_long_timeout = 5000
         self._get_long_timeout = 5000
 
     def __put_command(self, command, data, timeout): # private
-        self._put_short_timeout = self._put_short_timeout_reset
-        self._get_short_timeout = self._get_short_timeout_reset
-        out_header = self._set_packet(self._COMMAND_HEADER_PACKET_MAGIC, struct.pack("<II", command, len(data)))
-        out_data = self._set_packet(self._COMMAND_DATA_PACKET_MAGIC, data)
+        self._put_short_timeout = self._rto(self._put_short_timeout_reset, timeout)
+        self._get_short_timeout = self._rto(self._get_short_timeout_reset, timeout)
+        if self._host_mode:
+            if len(self.__out_data_buf) < len(data) + 4: self.__out_data_buf = bytearray(len(data) + 4)
+            out_header = self._set_packet_into(self.__out_header_buf, self._COMMAND_HEADER_PACKET_MAGIC, struct.pack("<II", command, len(data)))
+            out_data = self._set_packet_into(self.__out_data_buf, self._COMMAND_DATA_PACKET_MAGIC, data)
+        else:
+            out_header = self._set_packet(self._COMMAND_HEADER_PACKET_MAGIC, struct.pack("<II", command, len(data)))
+            out_data = self._set_packet(self._COMMAND_DATA_PACKET_MAGIC, data)
+        retry = False
+        data_sent = False
         start = int(time.time() * 1000)
         while (int(time.time() * 1000) - start) < timeout:
-            gc.collect() # Avoid collection during the transfer.
+            if retry: self._stats["retries"] += 1
+            if not self._host_mode: gc.collect() # Avoid collection during the transfer.
             self._zero(self.__in_command_header_buf[0], len(self.__in_command_header_buf[0]))
             self._zero(self.__in_command_data_buf[0], len(self.__in_command_data_buf[0]))
             self._flush()
-            self.put_bytes(out_header, self._put_short_timeout)
+            sent = time.time() * 1000
+            self._send(out_header, self._put_short_timeout)
             if self._get_packet(self._COMMAND_HEADER_PACKET_MAGIC, self.__in_command_header_buf, self._get_short_timeout) is not None:
-                self.put_bytes(out_data, self._put_long_timeout)
+                if not retry: self._rtt_sample((time.time() * 1000) - sent)
+                sent = time.time() * 1000
+                self._send(out_data, self._put_long_timeout)
                 if self._get_packet(self._COMMAND_DATA_PACKET_MAGIC, self.__in_command_data_buf, self._get_short_timeout) is not None:
+                    # The first data packet of a call is never a retransmission, so when the header had
+                    # to be retried its ack is the call's clean sample (a lost header is not a slow link).
+                    if retry and not data_sent: self._rtt_sample((time.time() * 1000) - sent)
                     return True
-            # Avoid timeout livelocking.
-            self._put_short_timeout = min((self._put_short_timeout * 4) // 3, timeout)
-            self._get_short_timeout = min((self._get_short_timeout * 4) // 3, timeout)
+                data_sent = True
+            # Avoid timeout livelocking, back off exponentially from the estimate.
+            retry = True
+            self._put_short_timeout = min(self._put_short_timeout * 2, timeout)
+            self._get_short_timeout = self._back_off(self._get_short_timeout, timeout)
         return False
 
     def __get_result(self, timeout): # private
-        self._put_short_timeout = self._put_short_timeout_reset
-        self._get_short_timeout = self._get_short_timeout_reset
+        self._put_short_timeout = self._rto(self._put_short_timeout_reset, timeout, False)
+        self._get_short_timeout = self._rto(self._get_short_timeout_reset, timeout, False)
+        retry = False
         start = int(time.time() * 1000)
         while (int(time.time() * 1000) - start) < timeout:
-            gc.collect() # Avoid collection during the transfer.
+            if retry: self._stats["retries"] += 1
+            if not self._host_mode: gc.collect() # Avoid collection during the transfer.
             self._zero(self.__in_result_header_buf[0], len(self.__in_result_header_buf[0]))
             self._flush()
-            self.put_bytes(self.__out_result_header_ack, self._put_short_timeout)
+            sent = time.time() * 1000
+            self._send(self.__out_result_header_ack, self._put_short_timeout)
             packet = self._get_packet(self._RESULT_HEADER_PACKET_MAGIC, self.__in_result_header_buf, self._get_short_timeout)
             if packet is not None:
-                in_result_data_buf = self._get_packet_pre_alloc(struct.unpack("<I", packet)[0])
-                self.put_bytes(self.__out_result_data_ack, self._put_short_timeout)
+                if not retry: self._rtt_sample((time.time() * 1000) - sent)
+                in_result_data_buf = self.__result_data_buf(struct.unpack("<I", packet)[0])
+                self._send(self.__out_result_data_ack, self._put_short_timeout)
                 dat_packet = self._get_packet(self._RESULT_DATA_PACKET_MAGIC, in_result_data_buf, self._get_long_timeout)
                 if dat_packet is not None:
                     return dat_packet
-            # Avoid timeout livelocking.
-            self._put_short_timeout = min((self._put_short_timeout * 4) // 3, timeout)
-            self._get_short_timeout = min((self._get_short_timeout * 4) // 3, timeout)
+            # Avoid timeout livelocking, back off exponentially from the estimate.
+            retry = True
+            # Neither kept nor used here (no _back_off): the first result header ack usually lands
+            # while the slave still runs the callback, so these timeouts do not measure the link.
+            self._put_short_timeout = min(self._put_short_timeout * 2, timeout)
+            self._get_short_timeout = min(self._get_short_timeout * 2, timeout)
         return None
 
+    # Host mode reuses one receive buffer, so a result is only valid until the next call.
+    def __result_data_buf(self, payload_len): # private
+        if not self._host_mode: return self._get_packet_pre_alloc(payload_len)
+        if len(self.__in_result_data_pool) < payload_len + 4: self.__in_result_data_pool = bytearray(payload_len + 4)
+        view = memoryview(self.__in_result_data_pool)
+        return (view[:payload_len + 4], view[2:payload_len + 2])
+
     def call(self, name, data=bytes(), send_timeout=1000, recv_timeout=1000): # public
-        return self.__get_result(recv_timeout) if self.__put_command(self._hash(name, len(name)), data, send_timeout) else None
+        self._stats["calls"] += 1
+        result = self.__get_result(recv_timeout) if self.__put_command(self._hash(name, len(name)), data, send_timeout) else None
+        if result is None: self._stats["failed_calls"] += 1
+        return result
 
 class rpc_slave(rpc):
 
@@ -301,14 +436,15 @@ class rpc_uart_master(rpc_master):
 
     # We need to do reads this way so that we get a short timeout while waiting for data and then
     # no timeout while data is coming in. pyserial inter_byte_timeout does not work.
+    # Reads fill buff through readinto. pyserial still copies out of its own read(), so what this
+    # saves is the per packet allocation (callers reuse buff), not the copy.
     def __get_bytes(self, buff):
+        view = memoryview(buff)
         i = 0
-        l = len(buff)
+        l = len(view)
         while l:
-            data = self.__ser.read(min(l, 1024)) # Starts a new timeout per call.
-            data_len = len(data)
+            data_len = self.__ser.readinto(view[i:i+min(l, 1024)]) # Starts a new timeout per call.
             if not data_len: return None
-            buff[i:i+data_len] = data
             i += data_len
             l -= data_len
         return buff
@@ -337,14 +473,15 @@ class rpc_uart_slave(rpc_slave):
 
     # We need to do reads this way so that we get a short timeout while waiting for data and then
     # no timeout while data is coming in. pyserial inter_byte_timeout does not work.
+    # Reads fill buff through readinto. pyserial still copies out of its own read(), so what this
+    # saves is the per packet allocation (callers reuse buff), not the copy.
     def __get_bytes(self, buff):
+        view = memoryview(buff)
         i = 0
-        l = len(buff)
+        l = len(view)
         while l:
-            data = self.__ser.read(min(l, 1024)) # Starts a new timeout per call.
-            data_len = len(data)
+            data_len = self.__ser.readinto(view[i:i+min(l, 1024)]) # Starts a new timeout per call.
             if not data_len: return None
-            buff[i:i+data_len] = data
             i += data_len
             l -= data_len
         return buff
@@ -371,14 +508,15 @@ class rpc_usb_vcp_master(rpc_master):
 
     # We need to do reads this way so that we get a short timeout while waiting for data and then
     # no timeout while data is coming in. pyserial inter_byte_timeout does not work.
+    # Reads fill buff through readinto. pyserial still copies out of its own read(), so what this
+    # saves is the per packet allocation (callers reuse buff), not the copy.
     def __get_bytes(self, buff):
+        view = memoryview(buff)
         i = 0
-        l = len(buff)
+        l = len(view)
         while l:
-            data = self.__ser.read(min(l, 1024)) # Starts a new timeout per call.
-            data_len = len(data)
+            data_len = self.__ser.readinto(view[i:i+min(l, 1024)]) # Starts a new timeout per call.
             if not data_len: return None
-            buff[i:i+data_len] = data
             i += data_len
             l -= data_len
         return buff
@@ -407,14 +545,15 @@ class rpc_usb_vcp_slave(rpc_slave):
 
     # We need to do reads this way so that we get a short timeout while waiting for data and then
     # no timeout while data is coming in. pyserial inter_byte_timeout does not work.
+    # Reads fill buff through readinto. pyserial still copies out of its own read(), so what this
+    # saves is the per packet allocation (callers reuse buff), not the copy.
     def __get_bytes(self, buff):
+        view = memoryview(buff)
         i = 0
-        l = len(buff)
+        l = len(view)
         while l:
-            data = self.__ser.read(min(l, 1024)) # Starts a new timeout per call.
-            data_len = len(data)
+            data_len = self.__ser.readinto(view[i:i+min(l, 1024)]) # Starts a new timeout per call.
             if not data_len: return None
-            buff[i:i+data_len] = data
             i += data_len
             l -= data_len
         return buff
@@ -437,296 +576,197 @@ class rpc_usb_vcp_slave(rpc_slave):
         if int(self.__ser.timeout) != 1: self.__ser.timeout = 1 # Changing this causes control transfers.
         return self.__get_bytes(buff)
 
-class rpc_network_master(rpc_master):
+# Shared by rpc_network_master / rpc_network_slave: packets up to _udp_limit bytes travel over UDP,
+# bigger ones (JPEGs) and streams over one persistent TCP connection. Reads land directly in the
+# caller's buffer (recv_into / recvfrom_into), writes go out as memoryview slices, no copies.
+class rpc_network(rpc):
 
-    def __valid_tcp_socket(self): # private
-        if self.__tcp__socket is None:
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.bind(self.__myaddr)
-                s.listen(0)
-                s.settimeout(1)
-                self.__tcp__socket, addr = s.accept()
-                s.close()
-            except (socket.timeout, socket.error): self.__tcp__socket = None
-        return self.__tcp__socket is not None
-
-    def __close_tcp_socket(self): # private
-        self.__tcp__socket.close()
-        self.__tcp__socket = None
-
-    def __valid_udp_socket(self): # private
-        if self.__udp__socket is None:
+    def _network_init(self, my_ip, port): # private
+        self._udp_limit = 1400
+        self._timeout_scale = 10
+        self._myaddr = (my_ip, port)
+        self._tcp_socket = None
+        self._udp_socket = None
+        print("IP Address:Port %s:%d\nRunning..." % self._myaddr)
+
+    def _open_tcp_socket(self): # protected
+        return None
+
+    def _peer_addr(self): # protected
+        return None
+
+    def _valid_tcp_socket(self): # protected
+        if self._tcp_socket is None:
+            self._tcp_socket = self._open_tcp_socket()
+            if self._tcp_socket is not None:
+                try: self._tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                except (AttributeError, socket.error): pass
+        return self._tcp_socket is not None
+
+    def _close_tcp_socket(self): # protected
+        self._tcp_socket.close()
+        self._tcp_socket = None
+
+    def _valid_udp_socket(self): # protected
+        if self._udp_socket is None:
             try:
-                self.__udp__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.__udp__socket.bind(self.__myaddr)
-            except (socket.timeout, socket.error): self.__udp__socket = None
-        return self.__udp__socket is not None
+                self._udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._udp_socket.bind(self._myaddr)
+            except (socket.timeout, socket.error): self._udp_socket = None
+        return self._udp_socket is not None
 
-    def __close_udp_socket(self): # private
-        self.__udp__socket.close()
-        self.__udp__socket = None
+    def _close_udp_socket(self): # protected
+        self._udp_socket.close()
+        self._udp_socket = None
 
-    def __init__(self, slave_ip, my_ip="", port=0x1DBA): # private
-        self._udp_limit = 1400
-        self._timeout_scale = 10
-        self.__myip = my_ip
-        self.__myaddr = (self.__myip, port)
-        self.__slave_addr = (slave_ip, port)
-        self.__tcp__socket = None
-        self.__udp__socket = None
-        print("IP Address:Port %s:%d\nRunning..." % self.__myaddr)
-        rpc_master.__init__(self)
+    def close(self): # public
+        if self._tcp_socket is not None: self._close_tcp_socket()
+        if self._udp_socket is not None: self._close_udp_socket()
 
     def _flush(self): # protected
-        if self.__valid_udp_socket():
+        if self._valid_udp_socket():
             try:
-                self.__udp__socket.settimeout(0.001)
+                self._udp_socket.settimeout(0.001)
                 while(True):
-                    data, addr = self.__udp__socket.recvfrom(1400)
+                    data, addr = self._udp_socket.recvfrom(1400)
                     if not len(data): break
             except socket.timeout: pass
-            except socket.error as err: self.__close_udp_socket()
-        if self.__tcp__socket is not None:
+            except socket.error: self._close_udp_socket()
+        if self._tcp_socket is not None:
             try:
-                self.__tcp__socket.settimeout(0.001)
+                self._tcp_socket.settimeout(0.001)
                 while(True):
-                    data = self.__tcp__socket.recvfrom(1400)
+                    data = self._tcp_socket.recv(1400)
                     if not len(data): break
             except socket.timeout: pass
-            except socket.error as err: self.__close_tcp_socket()
+            except socket.error: self._close_tcp_socket()
 
-    def get_bytes(self, buff, timeout_ms): # protected
+    def _udp_received(self, addr): # protected
+        pass
+
+    def _tcp_get_bytes(self, buff, timeout_ms): # protected
+        view = memoryview(buff)
         i = 0
-        l = len(buff)
-        if l <= self._udp_limit:
-            if self.__valid_udp_socket():
-                try:
-                    self.__udp__socket.settimeout(self._get_short_timeout * 0.001 * self._timeout_scale)
-                    while l:
-                        data, addr = self.__udp__socket.recvfrom(min(l, 1400))
-                        data_len = len(data)
-                        if not data_len: break
-                        buff[i:i+data_len] = data
-                        i += data_len
-                        l -= data_len
-                    # We don't need to close the socket on error since it's connectionless.
-                except socket.timeout: pass
-                except socket.error: self.__close_udp_socket()
-        elif self.__valid_tcp_socket():
+        l = len(view)
+        if self._valid_tcp_socket():
             try:
-                self.__tcp__socket.settimeout(100)
+                self._tcp_socket.settimeout(max(timeout_ms, 1) * 0.001)
                 while l:
-                    data = self.__tcp__socket.recv(min(l, 1400))
-                    data_len = len(data)
+                    data_len = self._tcp_socket.recv_into(view[i:], l)
                     if not data_len: break
-                    buff[i:i+data_len] = data
                     i += data_len
                     l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
+                if l: self._close_tcp_socket()
+            except socket.timeout:
+                if i: self._close_tcp_socket() # Partial packet, the byte stream is out of sync.
+            except socket.error: self._close_tcp_socket()
         return buff if not l else None
 
-    def put_bytes(self, data, timeout_ms): # protected
-        i = 0
-        l = len(data)
-        if l <= self._udp_limit:
-            if self.__valid_udp_socket():
-                try:
-                    self.__udp__socket.settimeout(self._put_short_timeout * 0.001 * self._timeout_scale)
-                    while l:
-                        data_len = self.__udp__socket.sendto(data[i:i+min(l, 1400)], self.__slave_addr)
-                        if not data_len: break
-                        i += data_len
-                        l -= data_len
-                    if l: self.__close_udp_socket()
-                except (socket.timeout, socket.error): self.__close_udp_socket()
-        elif self.__valid_tcp_socket():
+    def _tcp_put_bytes(self, data, timeout_ms): # protected
+        if self._valid_tcp_socket():
             try:
-                self.__tcp__socket.settimeout(100)
-                while l:
-                    data_len = self.__tcp_socket.send(data[i:i+min(l, 1400)])
-                    if not data_len: break
-                    i += data_len
-                    l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
+                self._tcp_socket.settimeout(max(timeout_ms, 1) * 0.001)
+                self._tcp_socket.sendall(memoryview(data))
+                return True
+            except (socket.timeout, socket.error): self._close_tcp_socket()
+        return False
 
-    def _stream_get_bytes(self, buff, timeout_ms): # protected
+    def get_bytes(self, buff, timeout_ms): # protected
+        if len(buff) > self._udp_limit: return self._tcp_get_bytes(buff, timeout_ms)
+        view = memoryview(buff)
         i = 0
-        l = len(buff)
-        if self.__valid_tcp_socket():
+        l = len(view)
+        if self._valid_udp_socket():
             try:
-                self.__tcp__socket.settimeout(timeout_ms * 0.001)
+                self._udp_socket.settimeout(self._get_short_timeout * 0.001 * self._timeout_scale)
                 while l:
-                    data = self.__tcp__socket.recv(min(l, 1400))
-                    data_len = len(data)
+                    data_len, addr = self._udp_socket.recvfrom_into(view[i:], min(l, 1400))
                     if not data_len: break
-                    buff[i:i+data_len] = data
+                    self._udp_received(addr)
                     i += data_len
                     l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
+                # We don't need to close the socket on error since it's connectionless.
+            except socket.timeout: pass
+            except socket.error: self._close_udp_socket()
         return buff if not l else None
 
-    def _stream_put_bytes(self, data, timeout_ms): # protected
+    def put_bytes(self, data, timeout_ms): # protected
+        if len(data) > self._udp_limit:
+            return self._tcp_put_bytes(data, timeout_ms)
+        view = memoryview(data)
         i = 0
-        l = len(data)
-        if self.__valid_tcp_socket():
+        l = len(view)
+        if self._valid_udp_socket():
             try:
-                self.__tcp__socket.settimeout(timeout_ms * 0.001)
+                self._udp_socket.settimeout(self._put_short_timeout * 0.001 * self._timeout_scale)
                 while l:
-                    data_len = self.__tcp__socket.send(data[i:i+min(l, 1400)])
+                    data_len = self._udp_socket.sendto(view[i:i+min(l, 1400)], self._peer_addr())
                     if not data_len: break
                     i += data_len
                     l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
-        if l: raise OSError # Stop Stream.
+                if l: self._close_udp_socket()
+            except (socket.timeout, socket.error, TypeError): self._close_udp_socket()
+        return not l
 
-class rpc_network_slave(rpc_slave):
+    def _stream_get_bytes(self, buff, timeout_ms): # protected
+        return self._tcp_get_bytes(buff, timeout_ms)
 
-    def __valid_tcp_socket(self): # private
-        if self.__tcp__socket is None:
-            try:
-                self.__tcp__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.__tcp__socket.connect(self.__master_addr)
-            except (socket.timeout, socket.error): self.__tcp__socket = None
-        return self.__tcp__socket is not None
+    def _stream_put_bytes(self, data, timeout_ms): # protected
+        if not self._tcp_put_bytes(data, timeout_ms): raise OSError # Stop Stream.
 
-    def __close_tcp_socket(self): # private
-        self.__tcp__socket.close()
-        self.__tcp__socket = None
+class rpc_network_master(rpc_network, rpc_master):
 
-    def __valid_udp_socket(self): # private
-        if self.__udp__socket is None:
-            try:
-                self.__udp__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.__udp__socket.bind(self.__myaddr)
-            except (socket.timeout, socket.error): self.__udp__socket = None
-        return self.__udp__socket is not None
+    # The listening socket is opened in __init__ and stays open for the life of the master, so a slave
+    # can (re)connect at any time instead of only while we happen to be blocked in accept().
+    def _open_tcp_socket(self): # protected
+        if self.__listen_socket is None: return None
+        try:
+            self.__listen_socket.settimeout(1)
+            s, addr = self.__listen_socket.accept()
+            return s
+        except (socket.timeout, socket.error): return None
 
-    def __close_udp_socket(self): # private
-        self.__udp__socket.close()
-        self.__udp__socket = None
+    def _peer_addr(self): # protected
+        return self.__slave_addr
 
-    def __init__(self, my_ip="", port=0x1DBA): # private
-        self._udp_limit = 1400
-        self._timeout_scale = 10
-        self.__myip = my_ip
-        self.__myaddr = (self.__myip, port)
-        self.__master_addr = None
-        self.__tcp__socket = None
-        self.__udp__socket = None
-        print("IP Address:Port %s:%d\nRunning..." % self.__myaddr)
-        rpc_slave.__init__(self)
+    def __init__(self, slave_ip, my_ip="", port=0x1DBA): # private
+        self.__slave_addr = (slave_ip, port)
+        self._network_init(my_ip, port)
+        self.__listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__listen_socket.bind(self._myaddr)
+        self.__listen_socket.listen(1)
+        rpc_master.__init__(self)
 
-    def _flush(self): # protected
-        if self.__valid_udp_socket():
-            try:
-                self.__udp__socket.settimeout(0.001)
-                while(True):
-                    data, addr = self.__udp__socket.recvfrom(1400)
-                    if not len(data): break
-            except socket.timeout: pass
-            except socket.error: self.__close_udp_socket()
-        if self.__tcp__socket is not None:
-            try:
-                self.__tcp__socket.settimeout(0.001)
-                while(True):
-                    data = self.__tcp__socket.recvfrom(1400)
-                    if not len(data): break
-            except socket.timeout: pass
-            except socket.error: self.__close_tcp_socket()
+    def close(self): # public
+        rpc_network.close(self)
+        if self.__listen_socket is not None:
+            self.__listen_socket.close()
+            self.__listen_socket = None
 
-    def get_bytes(self, buff, timeout_ms): # protected
-        i = 0
-        l = len(buff)
-        if l <= self._udp_limit:
-            if self.__valid_udp_socket():
-                try:
-                    self.__udp__socket.settimeout(self._get_short_timeout * 0.001 * self._timeout_scale)
-                    while l:
-                        data, addr = self.__udp__socket.recvfrom(min(l, 1400))
-                        data_len = len(data)
-                        if not data_len: break
-                        buff[i:i+data_len] = data
-                        self.__master_addr = addr
-                        i += data_len
-                        l -= data_len
-                    # We don't need to close the socket on error since it's connectionless.
-                except socket.timeout: pass
-                except socket.error: self.__close_udp_socket()
-        elif self.__valid_tcp_socket():
-            try:
-                self.__tcp__socket.settimeout(100)
-                while l:
-                    data = self.__tcp__socket.recv(min(l, 1400))
-                    data_len = len(data)
-                    if not data_len: break
-                    buff[i:i+data_len] = data
-                    i += data_len
-                    l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
-        return buff if not l else None
+class rpc_network_slave(rpc_network, rpc_slave):
 
-    def put_bytes(self, data, timeout_ms): # protected
-        i = 0
-        l = len(data)
-        if l <= self._udp_limit:
-            if self.__valid_udp_socket():
-                try:
-                    self.__udp__socket.settimeout(self._put_short_timeout * 0.001 * self._timeout_scale)
-                    while l:
-                        data_len = self.__udp__socket.sendto(data[i:i+min(l, 1400)], self.__master_addr)
-                        if not data_len: break
-                        i += data_len
-                        l -= data_len
-                    if l: self.__close_udp_socket()
-                except (socket.timeout, socket.error): self.__close_udp_socket()
-        elif self.__valid_tcp_socket():
-            try:
-                self.__tcp__socket.settimeout(100)
-                while l:
-                    data_len = self.__tcp__socket.send(data[i:i+min(l, 1400)])
-                    if not data_len: break
-                    i += data_len
-                    l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
+    def _open_tcp_socket(self): # protected
+        if self.__master_addr is None: return None
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.settimeout(1)
+            s.connect(self.__master_addr)
+            return s
+        except (socket.timeout, socket.error):
+            s.close()
+            return None
 
-    def _stream_get_bytes(self, buff, timeout_ms): # protected
-        i = 0
-        l = len(buff)
-        if self.__valid_tcp_socket():
-            try:
-                self.__tcp__socket.settimeout(timeout_ms * 0.001)
-                while l:
-                    data = self.__tcp__socket.recv(min(l, 1400))
-                    data_len = len(data)
-                    if not data_len: break
-                    buff[i:i+data_len] = data
-                    i += data_len
-                    l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
-        return buff if not l else None
+    def _peer_addr(self): # protected
+        return self.__master_addr
 
-    def _stream_put_bytes(self, data, timeout_ms): # protected
-        i = 0
-        l = len(data)
-        if self.__valid_tcp_socket():
-            try:
-                self.__tcp__socket.settimeout(timeout_ms * 0.001)
-                while l:
-                    data_len = self.__tcp__socket.send(data[i:i+min(l, 1400)])
-                    if not data_len: break
-                    i += data_len
-                    l -= data_len
-                if l: self.__close_tcp_socket()
-            except (socket.timeout, socket.error): self.__close_tcp_socket()
-        if l: raise OSError # Stop Stream.
+    def _udp_received(self, addr): # protected
+        self.__master_addr = addr
+
+    def __init__(self, my_ip="", port=0x1DBA): # private
+        self.__master_addr = None
+        self._network_init(my_ip, port)
+        rpc_slave.__init__(self)
 
 def get_can_settings(sampling_point):
     for bs1 in range(8):
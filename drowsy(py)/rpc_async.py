@@ -0,0 +1,489 @@
+# asyncio rpc master
+# same wire protocol as rpc.rpc_master (packets, CRCs, retries, stream_reader acks), but every
+# wait is an await instead of a blocking read + sleep, so one event loop can drive many ESP32
+# links at once (asyncio.gather over several masters) without a thread per camera.
+#
+#   async with rpc_async_usb_vcp_master("/dev/ttyACM0") as link:
+#       result = await link.call("jpeg_image_snapshot")
+#       async with link.frames(queue_depth=4) as frames:
+#           async for jpg in frames: ...
+#
+# a stream owns its link from entering the frames() block to leaving it; call() on that link
+# meanwhile raises instead of waiting, and leaving the block (break, exception) ends the stream.
+# a closed (or unplugged) link raises ConnectionError from call() and read_bytes() / write_bytes()
+# instead of retrying until the timeout, and a stream on it just ends.
+#
+# serial links read a non-blocking fd through loop.add_reader (Linux / macOS), network links use
+# an asyncio datagram endpoint for small packets and a TCP server for large ones, like
+# rpc_network_master.
+#
+# link quality (retries, CRC failures, timeouts, bytes/sec, SRTT / RTO) comes from get_stats(),
+# with the same adaptive retry timeouts as the blocking masters
+import asyncio
+import os
+import struct
+import termios
+
+import rpc
+
+
+class _Inbox:
+    # bytes received but not consumed yet; read_into() waits until enough of them arrived
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.need = 0
+        self.waiter = None
+
+    def feed(self, data):
+        self.buf += data
+        if self.waiter is not None and not self.waiter.done() and len(self.buf) >= self.need:
+            self.waiter.set_result(True)
+
+    def clear(self):
+        del self.buf[:]
+
+    def close(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(False)
+
+    async def read_into(self, buff, timeout_ms):
+        size = len(buff)
+        if len(self.buf) < size:
+            self.need = size
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                if not await asyncio.wait_for(self.waiter, timeout_ms * 0.001):
+                    return None  # link closed
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self.waiter = None
+        memoryview(buff)[:size] = memoryview(self.buf)[:size]
+        del self.buf[:size]
+        return buff
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, inbox):
+        self.inbox = inbox
+
+    def datagram_received(self, data, addr):
+        self.inbox.feed(data)
+
+
+async def _no_frames():
+    return
+    yield
+
+
+class _FrameStream:
+    # returned by rpc_async_master.frames(): an async context manager, so the stream (and the link it
+    # reserves) ends deterministically when the block is left, not when the generator is collected.
+    # start: optional coroutine function run first (e.g. the call asking the slave to stream);
+    # when it returns None there are no frames
+
+    def __init__(self, master, queue_depth, read_timeout_ms, start=None):
+        self.master = master
+        self.queue_depth = queue_depth
+        self.read_timeout_ms = read_timeout_ms
+        self.start = start
+        self.gen = None
+        self.streaming = False
+
+    async def __aenter__(self):
+        if self.start is not None and await self.start() is None:
+            self.gen = _no_frames()
+            return self
+        await self.master._begin_stream()
+        self.streaming = True
+        self.gen = self.master._frames(self.queue_depth, self.read_timeout_ms)
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.gen.aclose()
+        finally:
+            if self.streaming:
+                self.master._streaming = False
+                self.streaming = False
+
+    def __aiter__(self):
+        if self.gen is None:
+            raise RuntimeError("use frames() as: async with link.frames() as frames: async for data in frames")
+        return self.gen
+
+
+class rpc_async_master(rpc.rpc):
+    # transports implement open(), close(), _flush(), get_bytes() and put_bytes() (both raising
+    # ConnectionError once the link is closed); _stream_get_bytes() / _stream_put_bytes() default
+    # to the same calls
+
+    _min_timeout_ms = 1
+
+    def __init__(self):
+        rpc.rpc.__init__(self)
+        self._put_short_timeout_reset = 3
+        self._get_short_timeout_reset = 3
+        self._put_long_timeout = 5000
+        self._get_long_timeout = 5000
+        self.__out_result_header_ack = self._set_packet(self._RESULT_HEADER_PACKET_MAGIC)
+        self.__out_result_data_ack = self._set_packet(self._RESULT_DATA_PACKET_MAGIC)
+        self._lock = None  # one call at a time per link, created on the running loop
+        self._streaming = False  # a frames() block owns the link
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _flush(self):
+        pass
+
+    async def get_bytes(self, buff, timeout_ms):
+        return None
+
+    async def put_bytes(self, data, timeout_ms):
+        return False
+
+    async def _stream_get_bytes(self, buff, timeout_ms):
+        return await self.get_bytes(buff, timeout_ms)
+
+    async def _stream_put_bytes(self, data, timeout_ms):
+        if not await self.put_bytes(data, timeout_ms):
+            raise OSError  # Stop Stream.
+
+    def _locked(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _recv_packet(self, magic_value, payload_len, timeout_ms):
+        packet = await self.get_bytes(bytearray(payload_len + 4), timeout_ms)
+        if packet is None: self._stats["timeouts"] += 1
+        elif self._valid_packet(magic_value, packet):
+            self._stats["bytes_received"] += len(packet)
+            return memoryview(packet)[2:-2]
+        else: self._stats["crc_failures"] += 1
+        return None
+
+    async def _send(self, data, timeout_ms):
+        if not await self.put_bytes(data, timeout_ms):
+            return False
+        self._stats["bytes_sent"] += len(data)
+        return True
+
+    # raw transfers outside the packet protocol (the JPEG following jpeg_image_read), counted in the link stats
+    async def read_bytes(self, buff, timeout_ms):
+        data = await self.get_bytes(buff, timeout_ms)
+        if data is None: self._stats["timeouts"] += 1
+        else: self._stats["bytes_received"] += len(data)
+        return data
+
+    async def write_bytes(self, data, timeout_ms):
+        return await self._send(data, timeout_ms)
+
+    async def _put_command(self, command, data, timeout):
+        put_timeout = self._rto(self._put_short_timeout_reset, timeout)
+        get_timeout = self._rto(self._get_short_timeout_reset, timeout)
+        out_header = self._set_packet(self._COMMAND_HEADER_PACKET_MAGIC, struct.pack("<II", command, len(data)))
+        out_data = self._set_packet(self._COMMAND_DATA_PACKET_MAGIC, data)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout * 0.001
+        retry = False
+        data_sent = False
+        while loop.time() < deadline:
+            if retry: self._stats["retries"] += 1
+            self._flush()
+            sent = loop.time()
+            await self._send(out_header, put_timeout)
+            if await self._recv_packet(self._COMMAND_HEADER_PACKET_MAGIC, 0, get_timeout) is not None:
+                if not retry: self._rtt_sample((loop.time() - sent) * 1000)
+                sent = loop.time()
+                await self._send(out_data, self._put_long_timeout)
+                if await self._recv_packet(self._COMMAND_DATA_PACKET_MAGIC, 0, get_timeout) is not None:
+                    # the first data packet of a call is never a retransmission, so when the header had
+                    # to be retried its ack is the call's clean sample (a lost header is not a slow link)
+                    if retry and not data_sent: self._rtt_sample((loop.time() - sent) * 1000)
+                    return True
+                data_sent = True
+            # Avoid timeout livelocking, back off exponentially from the estimate.
+            retry = True
+            put_timeout = min(put_timeout * 2, timeout)
+            get_timeout = self._back_off(get_timeout, timeout)
+            await asyncio.sleep(0)  # a failed attempt may not have waited on anything
+        return False
+
+    async def _get_result(self, timeout):
+        put_timeout = self._rto(self._put_short_timeout_reset, timeout, False)
+        get_timeout = self._rto(self._get_short_timeout_reset, timeout, False)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout * 0.001
+        retry = False
+        while loop.time() < deadline:
+            if retry: self._stats["retries"] += 1
+            self._flush()
+            sent = loop.time()
+            await self._send(self.__out_result_header_ack, put_timeout)
+            packet = await self._recv_packet(self._RESULT_HEADER_PACKET_MAGIC, 4, get_timeout)
+            if packet is not None:
+                if not retry: self._rtt_sample((loop.time() - sent) * 1000)
+                payload_len = struct.unpack("<I", packet)[0]
+                await self._send(self.__out_result_data_ack, put_timeout)
+                result = await self._recv_packet(self._RESULT_DATA_PACKET_MAGIC, payload_len, self._get_long_timeout)
+                if result is not None:
+                    return result
+            # Avoid timeout livelocking, back off exponentially from the estimate.
+            retry = True
+            # Neither kept nor used here (no _back_off): the first result header ack usually lands
+            # while the slave still runs the callback, so these timeouts do not measure the link.
+            put_timeout = min(put_timeout * 2, timeout)
+            get_timeout = min(get_timeout * 2, timeout)
+            await asyncio.sleep(0)  # a failed attempt may not have waited on anything
+        return None
+
+    # result payload (a memoryview owned by the caller) or None; ConnectionError when the link is closed
+    async def call(self, name, data=bytes(), send_timeout=1000, recv_timeout=1000):
+        async with self._locked():
+            if self._streaming:
+                raise RuntimeError("link is streaming, leave the frames() block before calling")
+            self._stats["calls"] += 1
+            result = None
+            try:
+                if await self._put_command(self._hash(name, len(name)), data, send_timeout):
+                    result = await self._get_result(recv_timeout)
+            finally:
+                if result is None: self._stats["failed_calls"] += 1
+            return result
+
+    # frames of a slave running stream_writer, until the link fails:
+    #   async with link.frames() as frames:
+    #       async for data in frames: ...
+    def frames(self, queue_depth=1, read_timeout_ms=5000, start=None):
+        return _FrameStream(self, queue_depth, read_timeout_ms, start)
+
+    # waits for a call in flight, then reserves the link for a stream
+    async def _begin_stream(self):
+        async with self._locked():
+            if self._streaming:
+                raise RuntimeError("link is already streaming")
+            self._streaming = True
+
+    async def _frames(self, queue_depth, read_timeout_ms):
+        try: await self._stream_put_bytes(self._set_packet(0xEDF6, struct.pack("<I", queue_depth)), 1000)
+        except OSError: return
+        tx_lfsr = 255
+        while True:
+            try:
+                packet = await self._stream_get_bytes(bytearray(8), 1000)
+                if packet is None or not self._valid_packet(0x542E, packet): return
+                data = await self._stream_get_bytes(bytearray(struct.unpack("<I", packet[2:-2])[0]), read_timeout_ms)
+            except ConnectionError: return
+            if data is None: return
+            self._stats["bytes_received"] += len(packet) + len(data)
+            yield data
+            try: await self._stream_put_bytes(struct.pack("<B", tx_lfsr), 1000)
+            except OSError: return
+            tx_lfsr = (tx_lfsr >> 1) ^ (0xB8 if tx_lfsr & 1 else 0x00)
+
+    # rpc.stream_reader equivalent; call_back may be a plain function or a coroutine function
+    async def stream_reader(self, call_back, queue_depth=1, read_timeout_ms=5000):
+        async with self.frames(queue_depth, read_timeout_ms) as frames:
+            async for data in frames:
+                result = call_back(data)
+                if asyncio.iscoroutine(result):
+                    await result
+
+
+class rpc_async_usb_vcp_master(rpc_async_master):
+
+    _min_timeout_ms = 10  # same 10ms first-byte wait as the blocking serial masters
+
+    def __init__(self, port, baudrate=115200):
+        rpc_async_master.__init__(self)
+        self.port = port
+        self.baudrate = baudrate
+        self.__ser = None
+        self.__loop = None
+        self.__inbox = _Inbox()
+
+    async def open(self):
+        import serial
+        self.__loop = asyncio.get_running_loop()
+        self.__ser = serial.Serial(self.port, baudrate=self.baudrate, timeout=0, write_timeout=0)
+        os.set_blocking(self.__ser.fileno(), False)
+        self.__loop.add_reader(self.__ser.fileno(), self.__on_readable)
+
+    def close(self):
+        if self.__ser is not None:
+            self.__loop.remove_reader(self.__ser.fileno())
+            self.__ser.close()
+            self.__ser = None
+        self.__inbox.close()
+
+    # the tty is VMIN=0, so an empty read is not an end of file: it happens whenever the callback
+    # runs after the pending bytes were already read. An unplugged device hangs the tty up, which
+    # makes the read or the termios ioctls fail with an OSError / termios.error.
+    def __on_readable(self):
+        fd = self.__ser.fileno()
+        try:
+            data = os.read(fd, 65536)
+            if not data: termios.tcgetattr(fd)
+        except BlockingIOError: return
+        except (OSError, termios.error):
+            self.close()  # device unplugged
+            return
+        if data: self.__inbox.feed(data)
+
+    # drains the fd through the same non-blocking reads as the reader callback: reset_input_buffer()
+    # would discard bytes the already scheduled callback is about to read
+    def _flush(self):
+        if self.__ser is not None:
+            fd = self.__ser.fileno()
+            try:
+                while os.read(fd, 65536): pass
+            except BlockingIOError: pass
+            except OSError: pass  # reported by the next reader callback
+        self.__inbox.clear()
+
+    async def get_bytes(self, buff, timeout_ms):
+        if self.__ser is None: raise ConnectionError("%s is closed" % self.port)
+        return await self.__inbox.read_into(buff, max(timeout_ms, self._min_timeout_ms))
+
+    async def put_bytes(self, data, timeout_ms):
+        if self.__ser is None: raise ConnectionError("%s is closed" % self.port)
+        fd = self.__ser.fileno()
+        view = memoryview(data)
+        while len(view):
+            try: view = view[os.write(fd, view):]
+            except BlockingIOError: pass
+            except OSError as e:  # device unplugged
+                self.close()
+                raise ConnectionError("%s: %s" % (self.port, e))
+            if len(view) and not await self.__writable(fd, max(timeout_ms, self._min_timeout_ms)): return False
+        return True
+
+    async def __writable(self, fd, timeout_ms):
+        ready = self.__loop.create_future()
+        self.__loop.add_writer(fd, lambda: ready.done() or ready.set_result(True))
+        try:
+            return await asyncio.wait_for(ready, timeout_ms * 0.001)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.__loop.remove_writer(fd)
+
+    async def _stream_get_bytes(self, buff, timeout_ms):
+        return await self.get_bytes(buff, timeout_ms)
+
+
+class rpc_async_uart_master(rpc_async_usb_vcp_master):
+
+    def __init__(self, port, baudrate=9600):
+        rpc_async_usb_vcp_master.__init__(self, port, baudrate)
+
+
+class rpc_async_network_master(rpc_async_master):
+    # packets up to _udp_limit bytes go over UDP, bigger ones (and streams) over a TCP connection
+    # the slave opens to us, exactly like rpc_network_master / rpc_network_slave
+
+    def __init__(self, slave_ip, my_ip="", port=0x1DBA):
+        rpc_async_master.__init__(self)
+        self._udp_limit = 1400
+        self._timeout_scale = 10
+        self.__myaddr = (my_ip, port)
+        self.__slave_addr = (slave_ip, port)
+        self.__udp = None
+        self.__udp_inbox = _Inbox()
+        self.__server = None
+        self.__tcp = None
+        self._tcp_inbox = _Inbox()
+        self.__tcp_ready = None
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.__tcp_ready = asyncio.Event()
+        self.__udp, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self.__udp_inbox), local_addr=self.__myaddr)
+        self.__server = await loop.create_server(lambda: _TcpProtocol(self), self.__myaddr[0] or None, self.__myaddr[1])
+
+    def close(self):
+        if self.__udp is not None: self.__udp.close()
+        if self.__tcp is not None: self.__tcp.close()
+        if self.__server is not None: self.__server.close()
+        self.__udp = self.__tcp = self.__server = None
+        self.__udp_inbox.close()
+        self._tcp_inbox.close()
+
+    # a new connection from the slave replaces the previous one
+    def _tcp_connected(self, transport):
+        if self.__tcp is not None: self.__tcp.close()
+        self.__tcp = transport
+        self._tcp_inbox.clear()
+        self.__tcp_ready.set()
+
+    def _tcp_lost(self, transport):
+        if transport is self.__tcp:
+            self.__tcp = None
+            self.__tcp_ready.clear()
+            self._tcp_inbox.close()
+
+    async def __valid_tcp(self, timeout_ms):
+        if self.__udp is None: raise ConnectionError("link to %s:%d is closed" % self.__slave_addr)
+        if self.__tcp is None:
+            try: await asyncio.wait_for(self.__tcp_ready.wait(), timeout_ms * 0.001)
+            except asyncio.TimeoutError: return False
+        return True
+
+    def _flush(self):
+        self.__udp_inbox.clear()
+        self._tcp_inbox.clear()
+
+    async def get_bytes(self, buff, timeout_ms):
+        if self.__udp is None: raise ConnectionError("link to %s:%d is closed" % self.__slave_addr)
+        if len(buff) <= self._udp_limit:
+            return await self.__udp_inbox.read_into(buff, timeout_ms * self._timeout_scale)
+        return await self._tcp_inbox.read_into(buff, timeout_ms)
+
+    async def put_bytes(self, data, timeout_ms):
+        if self.__udp is None: raise ConnectionError("link to %s:%d is closed" % self.__slave_addr)
+        if len(data) <= self._udp_limit:
+            self.__udp.sendto(bytes(data), self.__slave_addr)
+            return True
+        if not await self.__valid_tcp(timeout_ms): return False
+        self.__tcp.write(bytes(data))
+        return True
+
+    async def _stream_get_bytes(self, buff, timeout_ms):
+        if not await self.__valid_tcp(timeout_ms): return None
+        return await self._tcp_inbox.read_into(buff, timeout_ms)
+
+    async def _stream_put_bytes(self, data, timeout_ms):
+        if not await self.__valid_tcp(timeout_ms): raise OSError  # Stop Stream.
+        self.__tcp.write(bytes(data))
+
+
+class _TcpProtocol(asyncio.Protocol):
+
+    def __init__(self, link):
+        self.link = link
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.link._tcp_connected(transport)
+
+    def data_received(self, data):
+        self.link._tcp_inbox.feed(data)
+
+    def connection_lost(self, exc):
+        self.link._tcp_lost(self.transport)
@@ -0,0 +1,95 @@
+# loopback throughput benchmark for the rpc network transport
+# runs an rpc_network_slave in a thread (127.0.0.2) serving payloads of a given size and drives it
+# from an rpc_network_master (127.0.0.1), the same call pattern as a WiFi ESP32 camera:
+# small packets over UDP, JPEG-sized results over the TCP connection, then a stream_reader run
+#
+# usage: python rpc_benchmark.py [--sizes 1000 20000 60000] [--calls 50] [--frames 200]
+# (needs the 127.0.0.2 loopback alias, present by default on Linux)
+import argparse
+import struct
+import sys
+import threading
+import time
+
+import rpc
+
+MASTER_IP = "127.0.0.1"
+SLAVE_IP = "127.0.0.2"
+
+
+def start_slave(port, payload):
+    slave = rpc.rpc_network_slave(my_ip=SLAVE_IP, port=port)
+
+    def payload_call(data):
+        size = struct.unpack("<I", data)[0]
+        return payload[:size]
+
+    def stream_call(data):
+        size = struct.unpack("<I", data)[0]
+        slave.schedule_callback(lambda: slave.stream_writer(lambda: payload[:size]))
+        return bytes()
+
+    slave.register_callback(payload_call)
+    slave.register_callback(stream_call)
+    threading.Thread(target=slave.loop, daemon=True).start()
+    return slave
+
+
+def bench_calls(master, size, calls):
+    ok = 0
+    start = time.perf_counter()
+    for _ in range(calls):
+        result = master.call("payload_call", struct.pack("<I", size), send_timeout=2000, recv_timeout=2000)
+        ok += result is not None and len(result) == size
+    return ok, time.perf_counter() - start
+
+
+def bench_stream(master, size, frames, queue_depth):
+    if master.call("stream_call", struct.pack("<I", size), send_timeout=2000, recv_timeout=2000) is None:
+        return 0, 0.0
+    got = [0]
+
+    def on_frame(data):
+        got[0] += 1
+        if got[0] >= frames:
+            raise StopIteration
+
+    start = time.perf_counter()
+    try:
+        master.stream_reader(on_frame, queue_depth=queue_depth, read_timeout_ms=2000)
+    except StopIteration:
+        pass
+    return got[0], time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="rpc network loopback benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000, 60000])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--queue-depth", type=int, default=4)
+    parser.add_argument("--port", type=int, default=0x1DBA)
+    args = parser.parse_args(argv)
+
+    payload = bytes(range(256)) * (max(args.sizes) // 256 + 1)
+    start_slave(args.port, payload)
+    master = rpc.rpc_network_master(SLAVE_IP, my_ip=MASTER_IP, port=args.port)
+    failed = 0
+    try:
+        for size in args.sizes:
+            ok, seconds = bench_calls(master, size, args.calls)
+            failed += args.calls - ok
+            print(f'call   {size:>6} B  {ok}/{args.calls} ok  {ok / seconds:8.1f} calls/s  {ok * size / seconds / 1e6:7.2f} MB/s')
+        print(master.get_stats())
+        size = max(args.sizes)
+        frames, seconds = bench_stream(master, size, args.frames, args.queue_depth)
+        failed += frames < args.frames
+        if seconds:
+            print(f'stream {size:>6} B  {frames}/{args.frames} frames  {frames / seconds:8.1f} frames/s  {frames * size / seconds / 1e6:7.2f} MB/s')
+    finally:
+        master.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,7 @@
 static uint8_t jpg_buf[20480];
 static uint16_t jpg_sz = 0;
 static bool read_flag = false;
+static bool stream_flag = false;
 
 openmv::rpc_scratch_buffer<256> scratch_buffer;
 openmv::rpc_callback_buffer<8> callback_buffer;
@@ -22,6 +23,8 @@ static void print_memory(void);
 size_t button_read_callback(void *out_data);
 size_t jpeg_image_snapshot_callback(void *out_data);
 size_t jpeg_image_read_callback(void *out_data);
+size_t jpeg_image_stream_callback(void *out_data);
+bool jpeg_image_stream_writer(uint8_t **out_data, uint32_t *out_data_len);
 
 // initialize hardware
 void setup() {
@@ -30,6 +33,7 @@ void setup() {
   rpc_slave.register_callback(F("button_read"), button_read_callback);
   rpc_slave.register_callback(F("jpeg_image_snapshot"), jpeg_image_snapshot_callback);
   rpc_slave.register_callback(F("jpeg_image_read"), jpeg_image_read_callback);
+  rpc_slave.register_callback(F("jpeg_image_stream"), jpeg_image_stream_callback);
   rpc_slave.begin();
   ESP_LOGI(TAG, "Setup complete");
 }
@@ -40,6 +44,13 @@ void loop() {
     rpc_slave.put_bytes(jpg_buf, jpg_sz, 10000);
     read_flag = false;
   }
+  if (stream_flag) {
+    // push frames until the host stops acknowledging them, then go back to normal rpc calls
+    if (rpc_slave.stream_writer_setup()) {
+      while (rpc_slave.stream_writer_loop(jpeg_image_stream_writer, 10000));
+    }
+    stream_flag = false;
+  }
   rpc_slave.loop();
 }
 
@@ -72,3 +83,18 @@ size_t jpeg_image_read_callback(void *out_data) {
   read_flag = true;
   return 0;
 }
+
+// start streaming jpeg frames (host calls stream_reader next)
+size_t jpeg_image_stream_callback(void *out_data) {
+  stream_flag = true;
+  return 0;
+}
+
+// take the next frame for the stream
+bool jpeg_image_stream_writer(uint8_t **out_data, uint32_t *out_data_len) {
+  jpg_sz = hw_camera_jpg_snapshot(jpg_buf);
+  if (!jpg_sz) return false;
+  *out_data = jpg_buf;
+  *out_data_len = jpg_sz;
+  return true;
+}
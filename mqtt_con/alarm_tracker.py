@@ -0,0 +1,97 @@
+# per-device continuous-alarm state, updated in O(1) per device event
+# replaces the rescan of the device's last 10 events on every alarm message. The rule is the same:
+#   slp_counter = number of consecutive alarm_status "1" events ending with the current one, each
+#                 at most 5 s after the one before it, counted over the last 10 events (so <= 10)
+#   slp_counter == 10: a LINE alert goes out when alert_delay_counter % 10 == 0, then the delay
+#                      counter is incremented; any shorter streak resets it to 0
+# so only the last event's timestamp, the streak length and the delay counter are kept per device.
+# On the first event of a device after a restart the state is rebuilt from its last 10 stored events
+# and device_log's alert_delay_counter. slp_counter / alert_delay_counter are still written to
+# device_log, through the bulk writer, so they are persisted once per flush.
+import logging
+from datetime import datetime, timedelta
+
+WINDOW = 10  # events looked back at, and the streak that triggers an alert
+MAX_GAP = timedelta(seconds=5)
+ALERT_EVERY = 10  # while the streak holds, alert on every 10th alarm event
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def parse_timestamp(value):
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class DeviceAlarm:
+
+    def __init__(self, last_ts=None, streak=0, alert_delay_counter=0):
+        self.last_ts = last_ts  # timestamp of the device's last alarm event
+        self.streak = streak  # consecutive alarm events ending with the last event, capped at WINDOW
+        self.alert_delay_counter = alert_delay_counter
+
+    # returns (slp_counter, send_alert) for an alarm event (ts: its datetime), None for any other event
+    def update(self, alarm, ts=None):
+        if not alarm:
+            self.streak = 0
+            return None
+        if self.streak and ts - self.last_ts <= MAX_GAP:
+            self.streak = min(self.streak + 1, WINDOW)
+        else:
+            self.streak = 1
+        self.last_ts = ts
+        send = False
+        if self.streak == WINDOW:
+            send = self.alert_delay_counter % ALERT_EVERY == 0
+            self.alert_delay_counter += 1
+        else:
+            self.alert_delay_counter = 0
+        return self.streak, send
+
+
+class AlarmTracker:
+
+    def __init__(self, events, log, writer=None):
+        self.events = events  # dev_db.device_events
+        self.log = log  # dev_db.device_log
+        self.writer = writer  # BulkWriter persisting slp_counter / alert_delay_counter, else update_one
+        self.devices = {}
+        self.loads = 0
+        self.updates = 0
+        self.alerts = 0
+
+    # state of a device seen for the first time: replay its last WINDOW events, oldest first
+    def _load(self, dev_id):
+        recent = list(self.events.find({'dev_id': dev_id}, {'_id': False, 'alarm_status': True, 'timestamp': True})
+                      .sort('_id', -1).limit(WINDOW))
+        state = DeviceAlarm()
+        for evt in reversed(recent):
+            alarm = evt['alarm_status'] == "1"
+            state.update(alarm, parse_timestamp(evt['timestamp']) if alarm else None)
+        log_doc = self.log.find_one({'dev_id': dev_id}, {'alert_delay_counter': True})
+        state.alert_delay_counter = (log_doc or {}).get('alert_delay_counter', 0)
+        self.loads += 1
+        logging.info('Alarm tracker: %s loaded, streak=%d alert_delay_counter=%d',
+                     dev_id, state.streak, state.alert_delay_counter)
+        return state
+
+    # call once per stored device event, before it is handed to the writer;
+    # returns (slp_counter, alert_delay_counter, send_alert) for alarm events, None otherwise
+    def update(self, dev_id, alarm_status, timestamp):
+        state = self.devices.get(dev_id)
+        if state is None:
+            state = self.devices[dev_id] = self._load(dev_id)
+        alarm = alarm_status == "1"
+        result = state.update(alarm, parse_timestamp(timestamp) if alarm else None)
+        self.updates += 1
+        if result is None:
+            return None
+        slp_counter, send = result
+        self.alerts += send
+        fields = {'slp_counter': slp_counter, 'alert_delay_counter': state.alert_delay_counter}
+        if self.writer is not None:
+            self.writer.set_fields(dev_id, fields)
+        else:
+            self.log.update_one({'dev_id': dev_id}, {'$set': fields})
+        return slp_counter, state.alert_delay_counter, send
+
+    def stats(self):
+        return {'devices': len(self.devices), 'loads': self.loads, 'updates': self.updates, 'alerts': self.alerts}
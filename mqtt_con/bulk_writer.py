@@ -0,0 +1,120 @@
+# write-behind buffer for the MQTT ingestion writes
+# device_events inserts are queued and written with insert_many every `interval` seconds or as
+# soon as `max_docs` are waiting; device_log $set updates (heartbeats, status) are merged per
+# device, so a device sending a heartbeat every second costs one update per flush, with only the
+# newest timestamp, instead of one round trip per message.
+# memory is bounded: once `max_pending` inserts are waiting, insert() blocks the caller (the paho
+# network thread, so the broker buffers for us) until the flusher catches up. close() stops the
+# flusher and writes whatever is left.
+import logging
+import threading
+import time
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+class BulkWriter:
+
+    def __init__(self, events, log, max_docs=500, interval=0.2, max_pending=50000, retry_delay=1.0):
+        self.events = events  # dev_db.device_events
+        self.log = log  # dev_db.device_log
+        self.max_docs = max_docs
+        self.interval = interval
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.docs = []
+        self.sets = {}  # dev_id -> merged $set fields
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()  # one batch in flight, in order
+        self.running = True
+        self.inserted = 0
+        self.updated = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.failed = 0
+        self.blocked = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def insert(self, doc):
+        with self.cond:
+            if len(self.docs) >= self.max_pending:
+                self.blocked += 1
+                self.cond.notify_all()
+                while len(self.docs) >= self.max_pending and self.running:
+                    self.cond.wait(self.interval)
+            self.docs.append(doc)
+            if len(self.docs) >= self.max_docs:
+                self.cond.notify_all()
+
+    # queue update_one({'dev_id': dev_id}, {'$set': fields}); newer fields overwrite pending ones
+    def set_fields(self, dev_id, fields):
+        with self.cond:
+            pending = self.sets.get(dev_id)
+            if pending is None:
+                self.sets[dev_id] = dict(fields)
+            else:
+                pending.update(fields)
+                self.coalesced += 1
+
+    def _run(self):
+        while self.running:
+            with self.cond:
+                if len(self.docs) < self.max_docs:
+                    self.cond.wait(self.interval)
+            self.flush()
+
+    # write everything queued so far; returns once it is in MongoDB (or failed for good)
+    def flush(self):
+        with self.write_lock:
+            with self.cond:
+                docs, self.docs = self.docs, []
+                sets, self.sets = self.sets, {}
+                self.cond.notify_all()  # wake producers blocked on max_pending
+            if docs:
+                self.inserted += len(docs) - self._write(lambda: self.events.insert_many(docs, ordered=False), docs, sets={})
+            if sets:
+                requests = [UpdateOne({'dev_id': dev_id}, {'$set': fields}) for dev_id, fields in sets.items()]
+                self.updated += len(requests) - self._write(lambda: self.log.bulk_write(requests, ordered=False), [], sets)
+            if docs or sets:
+                self.batches += 1
+
+    # runs write() until it succeeds; returns the number of documents / updates that failed for good
+    def _write(self, write, docs, sets):
+        attempts = 0
+        while True:
+            try:
+                write()
+                return 0
+            except BulkWriteError as e:  # some documents were rejected, the rest is written
+                errors = e.details.get('writeErrors', [])
+                if attempts:
+                    # insert_many set the _ids on the first attempt: documents that attempt already
+                    # wrote come back as duplicate keys (E11000) and are not failures
+                    errors = [err for err in errors if err.get('code') != 11000]
+                if errors:
+                    self.failed += len(errors)
+                    logging.error('Bulk write: %d writes rejected: %s', len(errors), errors[:1])
+                return len(errors)
+            except PyMongoError as e:  # connection trouble: keep the batch and retry
+                attempts += 1
+                if not self.running and attempts >= 3:  # shutting down: a few tries, then give up
+                    logging.error('Bulk write failed (%s), %d documents / %d updates lost', e, len(docs), len(sets))
+                    self.failed += len(docs) + len(sets)
+                    return len(docs) + len(sets)
+                logging.warning('Bulk write failed (%s), retrying in %ss', e, self.retry_delay)
+                time.sleep(self.retry_delay)
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+        self.flush()
+
+    def stats(self):
+        with self.cond:
+            pending = len(self.docs)
+        return {'inserted': self.inserted, 'updated': self.updated, 'coalesced': self.coalesced,
+                'batches': self.batches, 'pending': pending, 'failed': self.failed, 'blocked': self.blocked}
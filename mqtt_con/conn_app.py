@@ -1,23 +1,25 @@
 import os
 import sys
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from pytz import timezone
 import json
 import time
+import threading
+import signal
 
 from pymongo import MongoClient
 
 import paho.mqtt.client as mqtt
 
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    PushMessageRequest,
-    TextMessage
-)
-from pprint import pprint
+from device_registry import DeviceRegistry
+from bulk_writer import BulkWriter
+from alarm_tracker import AlarmTracker
+from driver_profiles import DriverProfiles
+
+from line_notifier import LineNotifier
+
+from linebot.v3.messaging import Configuration
 
 # timezone config
 tz = timezone(os.getenv('TZ', None))
@@ -87,9 +89,74 @@ if user_1_id is None:
     sys.exit(1)
 
 configuration = Configuration(
+    host=os.getenv('LINE_API_HOST', None), # e.g. http://localhost:8080 for line_mock.py; default api.line.me
     access_token=channel_access_token
 )
 
+# LINE alerts are queued and pushed by worker threads, never from the MQTT thread
+notifier = LineNotifier(configuration,
+                        workers=int(os.getenv('LINE_WORKERS', '2')),
+                        max_retries=int(os.getenv('LINE_MAX_RETRIES', '5')),
+                        rate=float(os.getenv('LINE_RATE', '1')), # messages/s per recipient
+                        dedup_window=float(os.getenv('LINE_DEDUP_SECONDS', '5')))
+
+# database & its collections for data from ESP32 data
+dev_db = mongo_client.dev_db
+dev_reg = dev_db.device # dev_id, car_driver_id, created_at, registered_at
+dev_log = dev_db.device_log # device_log_id: auto INC, dev_id, status
+dev_evts = dev_db.device_events # device_event_id: auto INC, dev_id, car_driver_id, eye_status, alarm_status, dev_location, value, timestamp
+# database & its collections for 
+car_db = mongo_client.car_db
+car_driver_db = car_db.car_driver # car_driver_db: auto INC, car_model, car_created_at, driver_name, driver_address, driver_contact, driver_registered_at
+#car_owner_db = car_db.car_owner # (car owner = admin level user): admin_id, auth
+
+# device registry cache: dev_id -> registration, kept fresh by a change stream (replica set) or TTL reloads
+registry_ttl = float(os.getenv('REGISTRY_TTL', '60'))
+registry_change_stream = os.getenv('REGISTRY_CHANGE_STREAM', '1') == '1'
+registry = DeviceRegistry(dev_reg, ttl=registry_ttl, use_change_stream=registry_change_stream).start()
+
+# write-behind buffer: device_events inserts batched with insert_many, device_log heartbeat/status
+# updates coalesced per device; flushed every BULK_INTERVAL_MS or BULK_MAX_DOCS events
+bulk_max_docs = int(os.getenv('BULK_MAX_DOCS', '500'))
+bulk_interval = float(os.getenv('BULK_INTERVAL_MS', '200')) / 1000
+bulk_max_pending = int(os.getenv('BULK_MAX_PENDING', '50000'))
+writer = BulkWriter(dev_evts, dev_log, max_docs=bulk_max_docs, interval=bulk_interval, max_pending=bulk_max_pending)
+
+# per-device continuous-alarm streaks; slp_counter / alert_delay_counter are persisted through the writer
+alarm_tracker = AlarmTracker(dev_evts, dev_log, writer)
+
+# driver profiles for the alert text, invalidated by a change stream on car_driver (replica set) or after PROFILE_TTL seconds
+# (the standalone mongo of compose-*.yaml has no change streams: edits reach alerts up to PROFILE_TTL seconds late)
+profile_ttl = float(os.getenv('PROFILE_TTL', '60'))
+driver_profiles = DriverProfiles(car_driver_db, ttl=profile_ttl, use_change_stream=registry_change_stream).start()
+
+
+# LINE alert text of a driver profile (None when car_driver_id is not registered)
+def render_alert(dev_id, car_driver_id, profile):
+    profile = profile or {}
+    return (f'dev_id: {dev_id} alarms continuously for greater than 1 min !\nContact Car Driver Immediately !!\nContact:\n'
+            f'car_driver_id: {car_driver_id}\n'
+            f'driver_name: {profile.get("driver_name")}\n'
+            f'driver_address: {profile.get("driver_address")}\n'
+            f'driver_contact: {profile.get("driver_contact")}\n'
+            f'driver_registered_at: {profile.get("driver_registered_at")}\n'
+            f'car_model: {profile.get("car_model")}\n'
+            f'car_created_at: {profile.get("car_created_at")}')
+
+
+# periodic metrics of the caches / buffers in front of MongoDB
+stats_interval = float(os.getenv('STATS_INTERVAL', '60'))
+
+
+def report_stats():
+    while True:
+        time.sleep(stats_interval)
+        logging.info('device registry: %s', registry.stats())
+        logging.info('bulk writer: %s', writer.stats())
+        logging.info('alarm tracker: %s', alarm_tracker.stats())
+        logging.info('driver profiles: %s', driver_profiles.stats())
+        logging.info('LINE notifier: %s', notifier.stats())
+
 
 # The callback for when the client receives a CONNACK response from the server.
 def on_connect(client, userdata, flags, reason_code, properties):
@@ -103,15 +170,6 @@ def on_connect(client, userdata, flags, reason_code, properties):
 
 def on_message(client, userdata, msg):
     logging.info('Received message: %s from %s', msg.payload, msg.topic)
-    # database & its collections for data from ESP32 data
-    dev_db = mongo_client.dev_db
-    dev_reg = dev_db.device # dev_id, car_driver_id, created_at, registered_at
-    dev_log = dev_db.device_log # device_log_id: auto INC, dev_id, status
-    dev_evts = dev_db.device_events # device_event_id: auto INC, dev_id, car_driver_id, eye_status, alarm_status, dev_location, value, timestamp
-    # database & its collections for 
-    car_db = mongo_client.car_db
-    car_driver_db = car_db.car_driver # car_driver_db: auto INC, car_model, car_created_at, driver_name, driver_address, driver_contact, driver_registered_at
-    #car_owner_db = car_db.car_owner # (car owner = admin level user): admin_id, auth
 
     # extract dev_id from its corresponding mqtt topic: either MQTT_CARID_LOG or MQTT_CARID_ALARM Topic
     dev_id = msg.topic.split('/')[-1]
@@ -132,31 +190,33 @@ def on_message(client, userdata, msg):
     
     # subscribe status from hardware module + heartbeat detector backend module
     if evt_type == 'status':
-        dev_doc = dev_reg.find_one({'dev_id': dev_id}, {'_id': False})
+        dev_doc = registry.get(dev_id)
         if dev_doc is not None:
-            dev_log.update_one({'dev_id': dev_id}, {'$set':{'status': msg_data['status']}})
+            writer.set_fields(dev_id, {'status': msg_data['status']})
     
     # for heartbeat mqtt topic
     if evt_type == 'heartbeat':
-        dev_doc = dev_reg.find_one({'dev_id': dev_id}, {'_id': False})
+        dev_doc = registry.get(dev_id)
         if dev_doc is not None: # recognize only registered dev_id's heartbeat
             #dev_latestms_dict[dev_id] = msg_data['timestamp']
-            dev_log.update_one({'dev_id': dev_id}, {'$set':{'latest_hb': msg_data['timestamp']}})
+            writer.set_fields(dev_id, {'latest_hb': msg_data['timestamp']}) # only the newest heartbeat per flush is written
 
     # for dev_evts mqtt topics
     #if (evt_type == 'log') or (evt_type == 'alarm'): # subject to change later, depending on hardware implementation result
     if (evt_type == 'log'):
-        car_driver_id = dev_reg.find_one({'dev_id':dev_id}, {'_id': False})['car_driver_id']
+        dev_doc = registry.get(dev_id) # one cached lookup for both the car_driver_id check and the registration
+        car_driver_id = dev_doc['car_driver_id'] if dev_doc is not None else None
         print(f'dev_id: {dev_id} || car_driver_id: {car_driver_id}')
         # check the dev_id, car_driver_id correctness
         ## proceed only if they are valid
         if (msg_data['dev_id'] == dev_id) and (msg_data['car_driver_id'] == car_driver_id):
-            dev_doc = dev_reg.find_one({'dev_id': dev_id}, {'_id':False})
             # Do the following if the dev_id of the hardware (which sent this mqtt message) is already registered in our database
             if dev_doc is not None:
+                # continuous-alarm state of this device, updated in O(1) (see alarm_tracker.py)
+                alarm = alarm_tracker.update(dev_id, msg_data['alarm_status'], msg_data['timestamp'])
                 #msg_data = json.loads(msg.payload) # get the payload of the mqtt mesage received
                 # insert msg_data into device_event database
-                dev_evts.insert_one({
+                writer.insert({
                     'dev_id': msg_data['dev_id'],
                     'car_driver_id': msg_data['car_driver_id'],
                     'eye_status': msg_data['eye_status'], # eye_status ({'eye': ???}) from ESP32's drowsiness detection module
@@ -168,101 +228,52 @@ def on_message(client, userdata, msg):
                 
                 # send LINE Bot Alert if {'alarm':1} for 1 min continuously
                 #if evt_type == 'alarm':
-                if msg_data['alarm_status'] == "1":
-                    #dev_log.update_one({'dev_id': dev_id}, {'$set':{'status':'alarm'}})
-                    dev_evts_last60 = list(dev_evts.find({'dev_id':dev_id}, {'_id': False}))[-10:]
-                    dev_evts_last60 = dev_evts_last60[-1::-1]
-                    dev_evts_lastmin = []
-                    prev_iter_timestamp = dev_log.find_one({'dev_id':dev_id}, {'prev_iter_timestamp':True})['prev_iter_timestamp']
-                    #slp_counter = dev_log.find_one({'dev_id':dev_id}, {'slp_counter':True})['slp_counter']
-                    alert_delay_counter = dev_log.find_one({'dev_id':dev_id}, {'alert_delay_counter':True})['alert_delay_counter']
+                if alarm is not None:
+                    slp_counter, alert_delay_counter, send_alert = alarm
                     print('==============')
                     print(f'dev_id: {dev_id} is alarming !!')
-                    print(f'prev_iter_timestamp: {prev_iter_timestamp}')
-
-                    for i in dev_evts_last60:
-                        # count sleep counter only if alarm = 1 (ON) and that timestamp is not far apart from its previous timestamp more than 5 sec
-                        #if (i['alarm_status'] == "1") and ((int(prev_iter_timestamp) - int(i['timestamp'])) <= 5):
-                        current_timestamp = datetime.strptime(i['timestamp'], "%Y-%m-%d %H:%M:%S.%f")
-                        if prev_iter_timestamp == 0:
-                            prev_iter_timestamp = current_timestamp + timedelta(seconds=1)
-                        #if (i['alarm_status'] == "1") and (((prev_iter_timestamp - current_timestamp) <= timedelta(seconds=5)) or (prev_iter_timestamp == 0)): # for actual use
-                        if (i['alarm_status'] == "1") and ((prev_iter_timestamp - current_timestamp) <= timedelta(seconds=5)):
-                            dev_evts_lastmin.append(i)
-                            # update prev_iter_timestamp variable
-                            #prev_iter_timestamp = int(i['timestamp']) # for mock test
-                            prev_iter_timestamp = current_timestamp # for actual use
-
-                            # update prev_iter_timestamp data in the dev_log database
-                            dev_log.update_one({'dev_id': dev_id}, {'$set':{'prev_iter_timestamp':prev_iter_timestamp}})
-
-                            
-                        else:
-                            break
-                    
                     print(f'latest_timestamp: {msg_data["timestamp"]}')
                     print('------')
-                    slp_counter = max(1, len(dev_evts_lastmin))
-                    dev_log.update_one({'dev_id':dev_id}, {'$set':{'slp_counter':slp_counter}})
                     print(f'slp_counter: {slp_counter}')
 
-                    if (slp_counter == 10):
-                        if (alert_delay_counter % 10 == 0):
-                            driver_name = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_name']
-                            driver_address = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_address']
-                            driver_contact = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_contact']
-                            driver_registered_at = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_registered_at']
-                            car_model = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['car_model']
-                            car_created_at = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['car_created_at']
-                            
-                            # LINE Bot Alert push message
-                            ## for mock test
-                            #print(f'dev_id: {dev_id} alarms continuously for greater than 1 min !\nContact Car Driver Immediately !!\nContact:\ncar_driver_id: {car_driver_id}\ndriver_name: {driver_name}\ndriver_address: {driver_address}\ndriver_contact: {driver_contact}\ndriver_registered_at: {driver_registered_at}\ncar_model: {car_model}\ncar_created_at: {car_created_at}')
-                        
-                            ## for actual implementation
-                            with ApiClient(configuration) as api_client:
-                                line_bot_api = MessagingApi(api_client) # api_instance
-                                driver_name = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_name']
-                                driver_address = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_address']
-                                driver_contact = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_contact']
-                                driver_registered_at = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['driver_registered_at']
-                                car_model = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['car_model']
-                                car_created_at = car_driver_db.find_one({'car_driver_id':car_driver_id}, {'_id':False})['car_created_at']
-                                noti_text = TextMessage(text=f'dev_id: {dev_id} alarms continuously for greater than 1 min !\nContact Car Driver Immediately !!\nContact:\ncar_driver_id: {car_driver_id}\ndriver_name: {driver_name}\ndriver_address: {driver_address}\ndriver_contact: {driver_contact}\ndriver_registered_at: {driver_registered_at}\ncar_model: {car_model}\ncar_created_at: {car_created_at}')
-                                #x_line_retry_key = 'x_line_retry_key_example' # make it yourself
-
-                                push_message_request = PushMessageRequest(
-                                    to=user_1_id,
-                                    messages=[noti_text]
-                                )
-                                try:
-                                    api_response = line_bot_api.push_message(push_message_request)
-                                    print("The response of MessagingApi->push_message:\n")
-                                    pprint(api_response)
-
-                                except Exception as e:
-                                    print("Exception when calling MessagingApi->push_message: %s\n" % e)
-                            
-                        alert_delay_counter += 1
-                        dev_log.update_one({'dev_id':dev_id}, {'$set':{'alert_delay_counter':alert_delay_counter}})
-
-                    else:
-                        alert_delay_counter = 0
-                        dev_log.update_one({'dev_id':dev_id}, {'$set':{'alert_delay_counter':alert_delay_counter}})
+                    if send_alert: # slp_counter == 10 and alert_delay_counter % 10 == 0
+                        # whole driver profile from the cache: one find_one per driver until it is edited
+                        alert_text = render_alert(dev_id, car_driver_id, driver_profiles.get(car_driver_id))
+
+                        # LINE Bot Alert push message
+                        ## for mock test
+                        #print(alert_text)
+
+                        ## for actual implementation: queued, pushed with retries by the notifier's workers
+                        notifier.notify(user_1_id, alert_text, dedup_key=dev_id)
 
                     print(f'alert_delay_counter: {alert_delay_counter}')
-                    # reset prev_iter_timestamp to 0 to prepare for next mqtt message    
-                    prev_iter_timestamp = 0
-                    dev_log.update_one({'dev_id': dev_id}, {'$set':{'prev_iter_timestamp':prev_iter_timestamp}})
                     print('==============')
 
                 #elif msg_data['alarm_status'] == "0":
                 #    dev_log.update_one({'dev_id': dev_id}, {'$set':{'status':'activated'}})
 
 # start instance
+threading.Thread(target=report_stats, daemon=True).start()
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 mqtt_client.enable_logger()
 mqtt_client.on_connect = on_connect
 mqtt_client.on_message = on_message
 mqtt_client.connect(mqtt_broker, int(mqtt_port), 60)
-mqtt_client.loop_forever()
\ No newline at end of file
+
+
+# docker stop sends SIGTERM: leave loop_forever() so the buffered writes are flushed below
+def shutdown(signum, frame):
+    logging.info('Signal %d received, shutting down.', signum)
+    mqtt_client.disconnect()
+
+
+signal.signal(signal.SIGTERM, shutdown)
+signal.signal(signal.SIGINT, shutdown)
+try:
+    mqtt_client.loop_forever()
+finally:
+    writer.close()
+    logging.info('bulk writer: %s', writer.stats())
+    notifier.close()
+    logging.info('LINE notifier: %s', notifier.stats())
\ No newline at end of file
@@ -0,0 +1,106 @@
+# in-memory cache of the device registry (dev_db.device)
+# every MQTT message needs its device's registration (dev_id -> car_driver_id), which changes a
+# few times a month, so the whole collection is loaded once and kept fresh:
+#   - with a change stream when MongoDB runs as a replica set (inserts, updates and deletes are
+#     applied as they happen)
+#   - otherwise (standalone mongod, as in compose-*.yaml) by reloading it every `ttl` seconds
+# unknown dev_ids are looked up once and remembered as unregistered until the next reload, so a
+# stray publisher cannot turn every message into a database query again.
+import logging
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+_MISSING = object()  # negative cache entry
+
+
+class DeviceRegistry:
+
+    def __init__(self, collection, ttl=60.0, use_change_stream=True):
+        self.collection = collection
+        self.ttl = ttl
+        self.use_change_stream = use_change_stream
+        self.mode = 'ttl'
+        self.devices = {}  # dev_id -> registration document (without _id)
+        self.ids = {}  # Mongo _id -> dev_id, to apply deletes from the change stream
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.changes = 0
+
+    def start(self):
+        stream = None
+        if self.use_change_stream:
+            try:
+                # opened before the initial load: a change made while loading is still replayed
+                # afterwards (applying it twice is harmless, fullDocument is the current document)
+                stream = self.collection.watch(full_document='updateLookup')
+            except PyMongoError as e:  # standalone server: change streams need a replica set
+                logging.info('Device registry: change streams unavailable (%s), reloading every %ss', e, self.ttl)
+        self.reload()
+        if stream is not None:
+            self.mode = 'change_stream'
+            threading.Thread(target=self._follow, args=(stream,), daemon=True).start()
+        logging.info('Device registry: %d devices loaded, mode=%s', len(self.devices), self.mode)
+        return self
+
+    def reload(self):
+        devices, ids = {}, {}
+        for doc in self.collection.find({}):
+            ids[doc['_id']] = doc['dev_id']
+            devices[doc['dev_id']] = {k: v for k, v in doc.items() if k != '_id'}
+        with self.lock:
+            self.devices, self.ids = devices, ids
+            self.loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def _follow(self, stream):
+        try:
+            with stream:
+                for change in stream:
+                    self._apply(change)
+        except PyMongoError as e:
+            logging.warning('Device registry: change stream stopped (%s), falling back to reloads every %ss', e, self.ttl)
+            self.mode = 'ttl'
+            self.loaded_at = 0.0  # reload on the next lookup
+
+    def _apply(self, change):
+        op = change['operationType']
+        _id = change['documentKey']['_id']
+        with self.lock:
+            self.changes += 1
+            if op == 'delete':
+                dev_id = self.ids.pop(_id, None)
+                if dev_id is not None:
+                    self.devices.pop(dev_id, None)
+            elif change.get('fullDocument') is not None:
+                doc = change['fullDocument']
+                old = self.ids.get(_id)
+                if old is not None and old != doc['dev_id']:
+                    self.devices.pop(old, None)
+                self.ids[_id] = doc['dev_id']
+                self.devices[doc['dev_id']] = {k: v for k, v in doc.items() if k != '_id'}
+
+    # registration document of dev_id, or None when the device is not registered
+    def get(self, dev_id):
+        if self.mode == 'ttl' and time.monotonic() - self.loaded_at > self.ttl:
+            self.reload()
+        doc = self.devices.get(dev_id)
+        if doc is not None:
+            self.hits += 1
+            return None if doc is _MISSING else doc
+        self.misses += 1
+        doc = self.collection.find_one({'dev_id': dev_id}, {'_id': False})
+        with self.lock:
+            self.devices[dev_id] = doc if doc is not None else _MISSING
+        return doc
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'mode': self.mode, 'devices': sum(doc is not _MISSING for doc in self.devices.values()),
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'reloads': self.reloads, 'changes': self.changes}
@@ -0,0 +1,89 @@
+# cache of car driver profiles (car_db.car_driver) for the LINE alert text
+# an alert needs the whole profile of one driver; it is fetched with a single find_one and kept:
+#   - until user_api edits or deletes it, seen through a change stream when MongoDB runs as a
+#     replica set
+#   - otherwise (standalone mongod, as in compose-*.yaml) for `ttl` seconds, so an edit shows up in
+#     alerts at most ttl seconds later
+# a standalone mongod has no change streams and user_api sends no other signal, so with the shipped
+# compose files nothing invalidates a profile early: after an edit (new contact, car model) or a
+# delete, alerts keep the old profile for up to ttl seconds. Lower PROFILE_TTL if that matters, or run
+# mongo as a replica set (mongod --replSet, rs.initiate()) to get edits at once.
+import logging
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+
+class DriverProfiles:
+
+    def __init__(self, collection, ttl=60.0, use_change_stream=True):
+        self.collection = collection
+        self.ttl = ttl
+        self.use_change_stream = use_change_stream
+        self.mode = 'ttl'
+        self.profiles = {}  # car_driver_id -> (profile without _id, fetched_at)
+        self.ids = {}  # Mongo _id -> car_driver_id, to apply deletes from the change stream
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0  # bumped by every change, so a lookup racing with an edit is not cached
+
+    def start(self):
+        if self.use_change_stream:
+            try:
+                stream = self.collection.watch(full_document='updateLookup')
+            except PyMongoError as e:  # standalone server: change streams need a replica set
+                logging.info('Driver profiles: change streams unavailable (%s), caching for %ss', e, self.ttl)
+                return self
+            self.mode = 'change_stream'
+            threading.Thread(target=self._follow, args=(stream,), daemon=True).start()
+        logging.info('Driver profiles: mode=%s', self.mode)
+        return self
+
+    def _follow(self, stream):
+        try:
+            with stream:
+                for change in stream:
+                    self._apply(change)
+        except PyMongoError as e:
+            logging.warning('Driver profiles: change stream stopped (%s), caching for %ss', e, self.ttl)
+            with self.lock:
+                self.mode = 'ttl'
+                self.profiles.clear()  # edits may have been missed
+
+    def _apply(self, change):
+        _id = change['documentKey']['_id']
+        doc = change.get('fullDocument')
+        with self.lock:
+            self.invalidations += 1
+            self.generation += 1
+            old = self.ids.pop(_id, None)
+            if old is not None:
+                self.profiles.pop(old, None)
+            if doc is not None:
+                self.profiles.pop(doc['car_driver_id'], None)  # fetched again on its next alert
+
+    # profile document of car_driver_id, or None when the driver is not registered
+    def get(self, car_driver_id):
+        entry = self.profiles.get(car_driver_id)
+        if entry is not None and (self.mode == 'change_stream' or time.monotonic() - entry[1] <= self.ttl):
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        generation = self.generation
+        doc = self.collection.find_one({'car_driver_id': car_driver_id})
+        if doc is None:
+            return None
+        _id = doc.pop('_id')
+        with self.lock:
+            if generation == self.generation:
+                self.ids[_id] = car_driver_id
+                self.profiles[car_driver_id] = (doc, time.monotonic())
+        return doc
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'mode': self.mode, 'profiles': len(self.profiles), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0, 'invalidations': self.invalidations}
@@ -0,0 +1,114 @@
+# local stand-in for the LINE Messaging API push endpoint, to test alerts without a LINE channel
+# accepts POST /v2/bot/message/push like api.line.me and prints every message; it can also be slow,
+# fail with 500 or throttle with 429 (Retry-After), and answers 409 to a repeated X-Line-Retry-Key
+# like the real API. GET /messages lists what was delivered.
+#
+# usage: python line_mock.py [--port 8080] [--latency 200] [--fail 0.2] [--throttle 0.1]
+#        LINE_API_HOST=http://localhost:8080 python conn_app.py
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PUSH_PATH = '/v2/bot/message/push'
+
+
+class MockLine:
+
+    def __init__(self, latency_ms=0.0, fail=0.0, throttle=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.fail = fail
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self.messages = []
+        self.retry_keys = set()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    # (status, headers, body) for one push request
+    def push(self, body, retry_key):
+        if self.latency_ms:
+            time.sleep(self.latency_ms * 0.001)
+        with self.lock:
+            self.requests += 1
+            r = self.random.random()
+            if r < self.throttle:
+                return 429, {'Retry-After': '1'}, {'message': 'The API rate limit has been exceeded.'}
+            if r < self.throttle + self.fail:
+                return 500, {}, {'message': 'Internal server error'}
+            if retry_key is not None:
+                if retry_key in self.retry_keys:
+                    return 409, {'x-line-accepted-request-id': retry_key}, {'message': 'The retry key is already accepted'}
+                self.retry_keys.add(retry_key)
+            self.messages.append(body)
+        print('push to %s: %s' % (body.get('to'), ' | '.join(m.get('text', '') for m in body.get('messages', []))), flush=True)
+        return 200, {}, {'sentMessages': [{'id': str(uuid.uuid4().int)[:18], 'quoteToken': uuid.uuid4().hex}
+                                          for _ in body.get('messages', [])]}
+
+
+def make_handler(line):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _reply(self, status, headers, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path != PUSH_PATH:
+                return self._reply(404, {}, {'message': 'Not found'})
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                return self._reply(401, {}, {'message': 'Authentication failed'})
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self._reply(*line.push(body, self.headers.get('X-Line-Retry-Key')))
+
+        def do_GET(self):
+            if self.path != '/messages':
+                return self._reply(404, {}, {'message': 'Not found'})
+            with line.lock:
+                self._reply(200, {}, {'requests': line.requests, 'messages': line.messages})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+# serve in a background thread, returns the server (server.server_address has the port)
+def serve(line, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(line))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mock LINE Messaging API push endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of every response in ms')
+    parser.add_argument('--fail', type=float, default=0.0, help='probability of a 500 response')
+    parser.add_argument('--throttle', type=float, default=0.0, help='probability of a 429 response')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    line = MockLine(args.latency, args.fail, args.throttle, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(line))
+    print('LINE_API_HOST=http://%s:%d' % server.server_address, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('%d requests, %d messages delivered' % (line.requests, len(line.messages)))
+
+
+if __name__ == '__main__':
+    main()
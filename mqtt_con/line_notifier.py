@@ -0,0 +1,182 @@
+# asynchronous LINE push notifications
+# notify() only queues the message and returns, so the MQTT network thread never waits on the LINE
+# API. A small pool of worker threads (each with its own ApiClient, keeping its HTTPS connection
+# open) delivers the queue:
+#   - retries network errors, 429 and 5xx with exponential backoff (or the server's Retry-After),
+#     always with the same X-Line-Retry-Key so LINE never delivers a message twice (a retry of an
+#     accepted request answers 409, counted as sent)
+#   - per-recipient token bucket (`rate` messages/s, bursts of `burst`)
+#   - the same (recipient, dedup_key) queued again within `dedup_window` seconds is dropped
+# messages waiting for a retry or for their recipient's rate limit sit in a timer heap instead of
+# holding a worker, so one throttled recipient does not delay the others.
+# the queue is bounded (`queue_size`); when it is full new notifications are dropped and counted.
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+
+from linebot.v3.messaging import ApiClient, MessagingApi, PushMessageRequest, TextMessage
+from linebot.v3.messaging.exceptions import ApiException
+
+
+class Notification:
+
+    def __init__(self, to, text):
+        self.to = to
+        self.text = text
+        self.retry_key = str(uuid.uuid4())  # X-Line-Retry-Key, the same for every attempt
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class LineNotifier:
+
+    def __init__(self, configuration, workers=2, queue_size=1000, max_retries=5, backoff=1.0, max_backoff=60.0,
+                 rate=1.0, burst=5, dedup_window=5.0):
+        self.configuration = configuration
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self.queue = queue.Queue(queue_size)
+        self.timers = []  # heap of (due, seq, notification): retries and rate limited messages
+        self.seq = itertools.count()
+        self.buckets = {}  # recipient -> [tokens, updated_at]
+        self.recent = {}  # (recipient, dedup_key) -> queued_at
+        self.lock = threading.Lock()
+        self.closing = False
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.deduped = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.max_latency = 0.0
+        self.workers = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    # queue a text message; False when it was deduplicated or the queue is full
+    def notify(self, to, text, dedup_key=None):
+        if self.closing:
+            self.dropped += 1
+            return False
+        now = time.monotonic()
+        key = (to, text if dedup_key is None else dedup_key)
+        with self.lock:
+            last = self.recent.get(key)
+            if last is not None and now - last < self.dedup_window:
+                self.deduped += 1
+                return False
+            self.recent[key] = now
+            if len(self.recent) > 1024:
+                self.recent = {k: t for k, t in self.recent.items() if now - t < self.dedup_window}
+        try:
+            self.queue.put_nowait(Notification(to, text))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning('LINE notifier: queue full, notification to %s dropped', to)
+            return False
+        self.queued += 1
+        return True
+
+    def _defer(self, notification, delay):
+        with self.lock:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.seq), notification))
+
+    # next notification to deliver, None once closing and nothing is left
+    def _next(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.timers and self.timers[0][0] <= now:
+                    return heapq.heappop(self.timers)[2]
+                timeout = min(self.timers[0][0] - now, 0.5) if self.timers else 0.5
+                idle = not self.timers
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                if self.closing and idle and self.queue.empty():
+                    return None
+
+    # 0 when a message may go to `to` now, else the seconds until its bucket has a token
+    def _take_token(self, to):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.setdefault(to, [self.burst, now])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+    def _run(self):
+        with ApiClient(self.configuration) as api_client:
+            api = MessagingApi(api_client)
+            while True:
+                notification = self._next()
+                if notification is None:
+                    return
+                self._deliver(api, notification)
+
+    def _deliver(self, api, notification):
+        wait = self._take_token(notification.to)
+        if wait:
+            self.rate_limited += 1
+            self._defer(notification, wait)
+            return
+        notification.attempts += 1
+        request = PushMessageRequest(to=notification.to, messages=[TextMessage(text=notification.text)])
+        try:
+            api.push_message(request, x_line_retry_key=notification.retry_key)
+        except ApiException as e:
+            if e.status == 409:  # an earlier attempt with this retry key was accepted
+                self._sent(notification)
+            elif e.status == 429 or e.status >= 500:
+                self._retry(notification, '%s %s' % (e.status, e.reason), (e.headers or {}).get('Retry-After'))
+            else:
+                self.failed += 1
+                logging.error('LINE notifier: push to %s rejected: %s %s %s', notification.to, e.status, e.reason, e.body)
+        except Exception as e:  # connection errors, timeouts
+            self._retry(notification, e)
+        else:
+            self._sent(notification)
+
+    def _sent(self, notification):
+        self.sent += 1
+        self.max_latency = max(self.max_latency, time.monotonic() - notification.queued_at)
+
+    def _retry(self, notification, error, retry_after=None):
+        if notification.attempts > self.max_retries:
+            self.failed += 1
+            logging.error('LINE notifier: push to %s failed after %d attempts: %s', notification.to, notification.attempts, error)
+            return
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = min(self.backoff * 2 ** (notification.attempts - 1), self.max_backoff) * random.uniform(0.5, 1.0)
+        self.retries += 1
+        logging.warning('LINE notifier: push to %s failed (%s), retry %d in %.1fs', notification.to, error, notification.attempts, delay)
+        self._defer(notification, delay)
+
+    # stop accepting work and give the workers up to `timeout` seconds to empty the queue
+    def close(self, timeout=10.0):
+        self.closing = True
+        end = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(end - time.monotonic(), 0))
+
+    def stats(self):
+        with self.lock:
+            pending = self.queue.qsize() + len(self.timers)
+        return {'queued': self.queued, 'sent': self.sent, 'failed': self.failed, 'retries': self.retries,
+                'deduped': self.deduped, 'dropped': self.dropped, 'rate_limited': self.rate_limited,
+                'pending': pending, 'max_latency_ms': round(self.max_latency * 1000, 1)}
@@ -177,13 +177,15 @@ async def on_cardriverregedit(request: Request):
         if auth == str(valid_auth):
             print(f'admin: {data["admin_id"]} authorized new device register.')
             data['registered_at'] = timestamp
-            # update data
-            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{'driver_name':data['driver_name']}})
-            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{'driver_address':data['driver_address']}})
-            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{'driver_contact':data['driver_contact']}})
-            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{'driver_registered_at':timestamp}})
-            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{'car_model':data['car_model']}})
-            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{'car_created_at':data['car_created_at']}})
+            # update data in one write, so readers (mqtt_con's driver profile cache) never see a half-edited driver
+            car_driver_db.update_one({'car_driver_id': data['car_driver_id']}, {'$set':{
+                'driver_name': data['driver_name'],
+                'driver_address': data['driver_address'],
+                'driver_contact': data['driver_contact'],
+                'driver_registered_at': timestamp,
+                'car_model': data['car_model'],
+                'car_created_at': data['car_created_at']
+            }})
 
             resp['edited_driver'] = str(car_driver_db.find_one({'car_driver_id':data['car_driver_id']}, {'_id':False}))
             return jsonable_encoder(resp)